@@ -32,6 +32,9 @@ class Config(object):
     # 25 sims and 500 episodes ~ 9 seconds per episode / 1.5 days for 30 iters
     num_episodes = 750
     num_sims = 40
+    # Number of leaves evaluated with each call to the network. With more than 1 the leaves of a
+    # batch are spread out with virtual loss (see MCTS.simulate_batch), 1 searches sequentially.
+    sim_batch_size = 1
     c_puct = 1
     # Should be set based on game length to encourage exploration in early moves
     temp_threshold = 6
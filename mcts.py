@@ -1,201 +1,457 @@
+import copy
 import numpy as np
 
-class Node(object):
-    """ A class that represents a node in MC search tree. 
-    A should include the following attributes:
-        N: the number of times this node has been selected from its parents
-        Q: the mean value of this state
-        P: the prior probability of selecting this node (ie. taking this action)
+class Tree(object):
     """
-    def __init__(self, parent, P, cur_player):
-        self.N = 0
-        self.Q = 0.0
-        self.P = P
-        self.child = {}
-        self.action_type = None # will be assigned upon expanding
-        self.cur_player = cur_player
-        self.parent = parent
-
-    def update(self, predicted_v):
-        """
-        Update node values from leaf evaluation.
-        Arguments:
-        leaf_value -- the value of subtree evaluation from the current player's perspective.        
+    MC search tree stored as a struct of arrays. Nodes and the edges to their children are rows of
+    preallocated numpy arrays that grow in chunks as the tree is expanded.
+    Node arrays (one row per node):
+        first_edge, num_edges: range of the edges to the children of the node (no edges until
+            the node is expanded)
+        action_type: index into ACTION_TYPES of the actions of the edges (-1 until expanded)
+        cur_player: 1 or -1 for the player to move at the node (0 until the node is visited)
+        parent_edge: the edge that leads to the node
+    Edge arrays (one row per edge):
+        P: the prior probability of selecting the edge (ie. taking this action)
+        N: the number of times the edge has been selected from its parent
+        W: the total value of the state the edge leads to over its N visits. The mean value Q is
+            W / N and is only computed when it is needed (see get_q). Values in the tree are
+            from the first player's point of view, like the game value, so the network values
+            (for the player to move) are converted when they are backed up.
+        action: flat index of the action into the action matrix of the parent's action type
+        parent: the node the edge leaves from
+        child: the node the edge leads to (-1 until the edge is first selected)
+    Edge 0 leads to the root (its parent is -1) so that the visit count of every node, including
+    the root, is the N of its parent edge.
+    The edges selected during a simulation are recorded in the path buffer, starting with edge 0,
+    and the value of the leaf is added to each of them by backup. Paths of leaves that are
+    evaluated in a batch are saved by the caller and carry a virtual loss until they are backed up.
+    """
+    ACTION_TYPES = ('PUT', 'CAP')
+    CHUNK = 4096
+    # Value of the loss added to each edge of a path that is waiting for its leaf to be evaluated
+    VIRTUAL_LOSS = 1.0
+
+    _NODE_ARRAYS = (('first_edge', np.int32), ('num_edges', np.int32), ('action_type', np.int8),
+                    ('cur_player', np.int8), ('parent_edge', np.int32))
+    _EDGE_ARRAYS = (('P', np.float32), ('N', np.int32), ('W', np.float32), ('action', np.int32),
+                    ('parent', np.int32), ('child', np.int32))
+
+    def __init__(self, cur_player=1, chunk=CHUNK):
+        self.chunk = chunk
+        for name, dtype in self._NODE_ARRAYS + self._EDGE_ARRAYS:
+            setattr(self, name, np.zeros(chunk, dtype=dtype))
+        self.path = np.zeros(64, dtype=np.int32)
+        self.path_length = 0
+        self.reset(cur_player)
+
+    def reset(self, cur_player):
+        """
+        Clear the tree and create a root node for the current player
         """
-        # Update mean value of the state
-        self.Q = (self.Q * self.N + predicted_v) / (self.N + 1.)
-        # Increment how many times the state has been visited
-        self.N += 1
+        self.root = 0
+        self.num_nodes = 1
+        self.num_edges_used = 1
+        self.first_edge[0] = 0
+        self.num_edges[0] = 0
+        self.action_type[0] = -1
+        self.cur_player[0] = cur_player
+        self.parent_edge[0] = 0
+        self.P[0] = 1.0
+        self.N[0] = 0
+        self.W[0] = 0.0
+        self.action[0] = -1
+        self.parent[0] = -1
+        self.child[0] = 0
 
-    def recurse_update(self, predicted_v):
+    def _reserve(self, arrays, used, count):
+        # Grow the arrays by whole chunks so that count more rows fit after the used rows
+        capacity = len(getattr(self, arrays[0][0]))
+        if used + count <= capacity:
+            return
+        chunks = (used + count - capacity + self.chunk - 1) // self.chunk
+        for name, dtype in arrays:
+            grown = np.zeros(capacity + chunks * self.chunk, dtype=dtype)
+            grown[:used] = getattr(self, name)[:used]
+            setattr(self, name, grown)
+
+    def get_child(self, edge):
         """
-        Call by MCTS to recursively propagate predicted_v up to ancestor
+        Returns the node the edge leads to. Child nodes are only created the first time their
+        edge is selected, so the size of the tree depends on the number of visited edges rather
+        than the number of legal actions.
         """
-        # If it is not root, this node's parent should be updated first.
-        if self.parent:
-            self.parent.recurse_update(predicted_v)
-        self.update(predicted_v)
+        child = self.child[edge]
+        if child == -1:
+            self._reserve(self._NODE_ARRAYS, self.num_nodes, 1)
+            child = self.num_nodes
+            self.first_edge[child] = 0
+            self.num_edges[child] = 0
+            self.action_type[child] = -1
+            self.cur_player[child] = 0
+            self.parent_edge[child] = edge
+            self.child[edge] = child
+            self.num_nodes += 1
+        return child
+
+    def is_leaf(self, node):
+        return self.num_edges[node] == 0
+
+    def get_action_type(self, node):
+        # Return 'PUT' or 'CAP' for the actions of the edges of an expanded node
+        return self.ACTION_TYPES[self.action_type[node]]
+
+    def get_edges(self, node):
+        # Return the range of edges to the children of the node as a slice
+        first = self.first_edge[node]
+        return slice(first, first + self.num_edges[node])
 
-    def expand(self, action_type, predicted_p):
+    def expand(self, node, action_type, actions, predicted_p):
         """
-        Expand the search tree by attaching child nodes to current state
+        Expand the search tree by adding an edge for each action to the node. Only the prior
+        and the action are stored, the child nodes are created later (see get_child).
         Args:
             action_type - 'PUT' or 'CAP' depending on the action
-            predicted_p - predicted probability from the neural network
+            actions - flat indices of the valid actions into the action matrix for action_type
+            predicted_p - predicted probability of each action from the neural network
         """
         assert abs(np.sum(predicted_p) - 1) < .0001
 
-        self.action_type = action_type
-        for action in zip(*np.where(predicted_p > 0)):
-            prob = predicted_p[action]
-            self.child[action] = Node(self, prob, 0)
+        keep = predicted_p > 0
+        actions = actions[keep]
+        count = len(actions)
+        self._reserve(self._EDGE_ARRAYS, self.num_edges_used, count)
+        edges = slice(self.num_edges_used, self.num_edges_used + count)
+        self.P[edges] = predicted_p[keep]
+        self.N[edges] = 0
+        self.W[edges] = 0.0
+        self.action[edges] = actions
+        self.parent[edges] = node
+        self.child[edges] = -1
 
-    def get_action(self, c_puct):
+        self.action_type[node] = self.ACTION_TYPES.index(action_type)
+        self.first_edge[node] = edges.start
+        self.num_edges[node] = count
+        self.num_edges_used += count
+
+    def get_q(self, edges):
         """
-        Gets best action based on current estimate of Q and U
+        Returns the mean value of the edges, 0 for edges that have not been visited
         """
-        max_u = float('-inf')
-        best_a = None
-        next_node = None
+        return self.W[edges] / np.maximum(self.N[edges], 1)
 
-        for action, node in self.child.items():
-            # TODO: (feature add) scale the prior probabilities for the root node based on the size
-            #       of the typical action state space (page 14 AlphaZero paper).
-            U = self.cur_player * node.Q + c_puct * node.P * np.sqrt(self.N) / (1. + node.N)
-            if U > max_u:
-                max_u = U
-                best_a = action
-                next_node = node
+    def start_path(self):
+        """
+        Start recording the path of a new simulation at the root
+        """
+        self.path[0] = self.parent_edge[self.root]
+        self.path_length = 1
 
-        return self.action_type, best_a, next_node
+    def select(self, node, c_puct):
+        """
+        Gets the edge of the best action based on current estimate of Q and U. The scores of all
+        of the edges of the node are computed at once and ties go to the first edge. The selected
+        edge is added to the path of the simulation.
+        """
+        # TODO: (feature add) scale the prior probabilities for the root node based on the size
+        #       of the typical action state space (page 14 AlphaZero paper).
+        edges = self.get_edges(node)
+        sqrt_n = np.sqrt(self.N[self.parent_edge[node]])
+        U = self.cur_player[node] * self.get_q(edges) + \
+            c_puct * sqrt_n * self.P[edges] / (1. + self.N[edges])
+        edge = edges.start + int(np.argmax(U))
+
+        if self.path_length == len(self.path):
+            self.path = np.concatenate((self.path, np.zeros_like(self.path)))
+        self.path[self.path_length] = edge
+        self.path_length += 1
+        return edge
+
+    def backup(self, predicted_v, path=None):
+        """
+        Add the value of the leaf to every edge on the path of the simulation, from the root to
+        the leaf, and count one more visit for each of them. The path of the last simulation is
+        used unless a saved path is given.
+        """
+        if path is None:
+            path = self.path[:self.path_length]
+        self.N[path] += 1
+        self.W[path] += predicted_v
+
+    def add_virtual_loss(self, path, visits=1):
+        """
+        Count the edges of a saved path as visited and lost by the player selecting them until
+        the value of its leaf is backed up, so that other simulations select different edges.
+        Edge 0 only gets the visits since it is never selected.
+        """
+        self.N[path] += visits
+        edges = path[1:]
+        self.W[edges] -= visits * self.VIRTUAL_LOSS * self.cur_player[self.parent[edges]]
+
+    def remove_virtual_loss(self, path):
+        self.add_virtual_loss(path, -1)
+
+    def set_root(self, node):
+        """
+        Make the node the root of the tree and discard every node that is not below it. The kept
+        nodes and edges are copied to the start of the arrays, so the memory of the discarded
+        parts of the tree is reused and the new root is node 0.
+        """
+        # Find the kept nodes in breadth first order along with their edges
+        nodes = [node]
+        edge_ranges = []
+        for kept in nodes:
+            edges = self.get_edges(kept)
+            if edges.stop > edges.start:
+                edge_ranges.append(np.arange(edges.start, edges.stop))
+                nodes.extend(child for child in self.child[edges].tolist() if child != -1)
+        nodes = np.array(nodes)
+        edges = np.concatenate([[self.parent_edge[node]]] + edge_ranges).astype(np.intp)
 
-    def is_leaf(self):
-        return self.child == {}
+        # New index of each kept node and edge
+        node_index = np.full(self.num_nodes, -1, dtype=np.int32)
+        node_index[nodes] = np.arange(len(nodes))
+        edge_index = np.zeros(self.num_edges_used, dtype=np.int32)
+        edge_index[edges] = np.arange(len(edges))
+
+        for name, _ in self._NODE_ARRAYS:
+            array = getattr(self, name)
+            array[:len(nodes)] = array[nodes]
+        for name, _ in self._EDGE_ARRAYS:
+            array = getattr(self, name)
+            array[:len(edges)] = array[edges]
+        self.first_edge[:len(nodes)] = edge_index[self.first_edge[:len(nodes)]]
+        self.parent_edge[:len(nodes)] = edge_index[self.parent_edge[:len(nodes)]]
+        self.parent[1:len(edges)] = node_index[self.parent[1:len(edges)]]
+        children = self.child[1:len(edges)]
+        self.child[1:len(edges)] = np.where(children == -1, -1, node_index[children])
+        # Edge 0 leads to the new root and keeps its visit count
+        self.parent_edge[0] = 0
+        self.parent[0] = -1
+        self.child[0] = 0
+        self.root = 0
+        self.num_nodes = len(nodes)
+        self.num_edges_used = len(edges)
 
 class MCTS(object):
-    def __init__(self, game, nnet, c_puct, num_sim):
+    def __init__(self, game, nnet, c_puct, num_sim, batch_size=1):
         """
         Arguments:
             policy_fn: is a function to that returns (p, v) tuple given a state. 
                 Called when reached a leaf node in tree. In the case of AlphaZero, it is a NN.
             num_sim: number of simulations to run before selecting move
+            batch_size: number of leaves to evaluate with each call to the network. With more
+                than 1 the network must have predict_batch (see simulate_batch).
         """
         self.game = game
         self.nnet = nnet
         self.c_puct = c_puct
         self.num_sim = num_sim
-        self.root = Node(None, 1.0, 1)
+        self.batch_size = batch_size
+        self.tree = Tree(1)
+        # Copy of the game that the simulations are run on, loaded with the state of each search
+        self.search_game = copy.deepcopy(self.game)
 
     def reset(self, cur_player):
         # Reset the tree and create a root node for the current player
-        self.root = Node(None, 1.0, cur_player)
+        self.tree.reset(cur_player)
 
     def move_root(self, action, cur_player):
         # Move the root to the child node corresponding to the action.
         # Requires cur_player in case the action isn't already a child.
-        if action in self.root.child and self.root.child[action].cur_player != 0:
-            self.root = self.root.child[action]
-            self.root.parent = None
+        tree = self.tree
+        if tree.is_leaf(tree.root):
+            self.reset(cur_player)
+            return
+        action_type = tree.get_action_type(tree.root)
+        action = np.ravel_multi_index(action, self.get_action_shape(action_type))
+        edges = tree.get_edges(tree.root)
+        matches = np.flatnonzero(tree.action[edges] == action)
+        child = tree.child[edges.start + matches[0]] if len(matches) else -1
+        if child != -1 and tree.cur_player[child] != 0:
+            tree.set_root(child)
         else:
             self.reset(cur_player)
 
-    def simulate(self, board_state):
+    def get_action_shape(self, action_type):
+        # Return the shape of the action matrix for the action type
+        if action_type == 'PUT':
+            return self.game.get_placement_action_shape()
+        return self.game.get_capture_action_shape()
+
+    def _descend(self, game):
+        """
+        Select edges from the root until a leaf is found, making the moves on the game in place.
+        The path of the simulation is recorded in the tree.
+        Returns the leaf node, the undo records of the moves and the state, game value and legal
+        actions of the leaf (see ZertzGame.evaluate).
+        """
+        tree = self.tree
+        node = tree.root
+        undo = []
+        tree.start_path()
+
+        if tree.is_leaf(node):
+            state, game_value, legal, _ = game.evaluate()
+        while not tree.is_leaf(node):
+            action_type = tree.get_action_type(node)
+            edge = tree.select(node, self.c_puct)
+            action = np.unravel_index(tree.action[edge], self.get_action_shape(action_type))
+            node = tree.get_child(edge)
+            if tree.is_leaf(node):
+                # The position after the last action is evaluated as the move is made
+                record, state, game_value, legal, player_value = game.make_move_and_evaluate(
+                        action, action_type)
+                if tree.cur_player[node] == 0:
+                    tree.cur_player[node] = player_value
+            else:
+                record = game.make_move(action, action_type)
+            undo.append(record)
+        return node, undo, state, game_value, legal
+
+    def _expand_leaf(self, game, node, legal, symmetry_id, p_placement, p_capture, v):
+        """
+        Add the edges of a leaf using the policy predicted for a symmetrical state of the leaf.
+        Returns the predicted value of the leaf from the first player's point of view.
+        """
+        action_type, actions = legal
+        p_placement = np.squeeze(p_placement)
+        p_capture = np.squeeze(p_capture)
+        v = np.squeeze(v)
+
+        # Translate the actions and value back for the current board_state
+        p_placement = game.translate_action_symmetry('PUT', symmetry_id, p_placement, True)
+        p_capture = game.translate_action_symmetry('CAP', symmetry_id, p_capture, True)
+        v = game.translate_value_symmetry(symmetry_id, v)
+        # The network predicts the value for the player to move at the leaf
+        v = v * self.tree.cur_player[node]
+
+        # Keep the probabilities of the valid actions
+        if action_type == 'PUT':
+            p_actions = p_placement.ravel()[actions]
+        else:
+            p_actions = p_capture.ravel()[actions]
+        if np.sum(p_actions) == 0:
+            p_actions = np.ones(len(actions), dtype=np.float32)
+        p_actions = p_actions / np.sum(p_actions)
+        self.tree.expand(node, action_type, actions, p_actions)
+        return v
+
+    def simulate(self, game):
         """
-        Perform one simulation of MCTS. Recursively called until a leaf is found.
+        Perform one simulation of MCTS. Edges are selected from the root until a leaf is found.
         Then uses policy_fn to make prediction of (p,v). This value is propogated up the 
         path.
         Args:
-            board_state is a 3-D array representing game state
+            game is a game at the root state. Moves are made on it in place while descending the
+            tree and are undone before returning.
         """
-        node = self.root
-
-        while True:
-            if node.is_leaf():
-                break
-            action_type, best_a, node = node.get_action(self.c_puct)
-            next_board_state, player_value = self.game.get_next_state(best_a, action_type, board_state)
-            if node.cur_player == 0:
-                node.cur_player = player_value
-            board_state = next_board_state
-        
-        # Check if the leaf node is a game over state
-        game_value = self.game.get_game_ended(board_state)
+        node, undo, state, game_value, legal = self._descend(game)
 
         if game_value == 0:
             # No player has won, predict the policy distribution and state value to add nodes
             # TODO: remove the below code because action_filter isn't needed to predict anymore
             # Get which type of action is valid from the leaf node board state
-            valid_placement, valid_capture = self.game.get_valid_actions(board_state)
-            if np.any(valid_placement == True):
+            if legal[0] == 'PUT':
                 action_filter = 1
             else:
                 action_filter = 0
 
             # Get a symmetrical board_state and call predict to get the policy and value
-            symmetries = self.game.get_symmetries(board_state)
-            selected_symmetry = symmetries[np.random.choice(np.arange(len(symmetries)))]
-            symmetry_id, symmetrical_state = selected_symmetry
+            symmetry_id = np.random.randint(game.get_num_symmetries())
+            symmetrical_state = game.get_symmetry(symmetry_id, state)
 
             # TODO: (feature add) split the policy into placement and capture and reshape them
             p_placement, p_capture, v = self.nnet.predict(symmetrical_state, action_filter)
-            p_placement = np.squeeze(p_placement)
-            p_capture = np.squeeze(p_capture)
-            v = np.squeeze(v)
-
-            # Translate the actions back for the current board_state
-            p_placement = self.game.translate_action_symmetry('PUT', symmetry_id, p_placement)
-            p_capture = self.game.translate_action_symmetry('CAP', symmetry_id, p_capture)
-            # For planned changes to opponent symmetry generation
-            if symmetry_id > 3:
-                v = -v
-
-            if np.any(valid_placement):
-                p_placement = np.multiply(p_placement, valid_placement)
-                if np.sum(p_placement) == 0:
-                    p_placement = valid_placement.astype(np.float32)
-                p_placement /= np.sum(p_placement)
-                node.expand('PUT', p_placement)
-            else:
-                p_capture = np.multiply(p_capture, valid_capture)
-                if np.sum(p_capture) == 0:
-                    p_capture = valid_capture.astype(np.float32)
-                p_capture /= np.sum(p_capture)
-                node.expand('CAP', p_capture)
+            v = self._expand_leaf(game, node, legal, symmetry_id, p_placement, p_capture, v)
 
         else:
             # If game is over we know the true value of the game
             v = game_value
 
+        # Return the game to the root state
+        for record in reversed(undo):
+            game.unmake_move(record)
+
         # Use the true or predicted value of the game to update the nodes
-        node.recurse_update(v)
+        self.tree.backup(v)
+
+    def simulate_batch(self, game, count):
+        """
+        Perform up to count simulations of MCTS with a single call to the network. The paths are
+        descended one after the other with a virtual loss added to the edges of each path, so
+        that the following paths are pushed towards other leaves. The states of the leaves are
+        predicted as one batch, then the leaves are expanded, the virtual losses are removed and
+        the values are backed up.
+        The batch ends early if a path reaches a leaf that is already in the batch.
+        Returns the number of simulations that were performed.
+        """
+        tree = self.tree
+        num_sim = 0
+        leaves = []
+        while num_sim + len(leaves) < count:
+            node, undo, state, game_value, legal = self._descend(game)
+            for record in reversed(undo):
+                game.unmake_move(record)
+            if game_value != 0:
+                # If game is over we know the true value of the game
+                tree.backup(game_value)
+                num_sim += 1
+                continue
+            if any(node == leaf[0] for leaf in leaves):
+                break
+            path = tree.path[:tree.path_length].copy()
+            tree.add_virtual_loss(path)
+            symmetry_id = np.random.randint(game.get_num_symmetries())
+            leaves.append((node, path, legal, symmetry_id, game.get_symmetry(symmetry_id, state)))
+
+        if leaves:
+            # Predict every leaf at once
+            states = np.stack([leaf[4] for leaf in leaves])
+            p_placement, p_capture, v = self.nnet.predict_batch(states)
+            for i, (node, path, legal, symmetry_id, _) in enumerate(leaves):
+                value = self._expand_leaf(game, node, legal, symmetry_id,
+                                          p_placement[i], p_capture[i], v[i])
+                tree.remove_virtual_loss(path)
+                tree.backup(value, path)
+        return num_sim + len(leaves)
 
     def get_action_prob(self, state, temp):
         # Return the actions and corresponding probabilities for the current state.
         #   temp is the temperature to control exploration/eploitation
-        for _ in xrange(self.num_sim):
-            state_copy = np.copy(state)
-            self.simulate(state_copy)
+        # Every simulation starts from the same copy of the game
+        game = self.search_game
+        game.board.state = np.copy(state)
+        if self.batch_size == 1:
+            for _ in xrange(self.num_sim):
+                self.simulate(game)
+        else:
+            num_sim = 0
+            while num_sim < self.num_sim:
+                num_sim += self.simulate_batch(game, min(self.batch_size, self.num_sim - num_sim))
 
         # Get list of actions from tree root and number of times each child has been visited
-        action_type = self.root.action_type
-        action_visits = [(action, node.N) for action, node in self.root.child.items()]
-        actions, visits = zip(*action_visits)
+        tree = self.tree
+        action_type = tree.get_action_type(tree.root)
+        edges = tree.get_edges(tree.root)
+        actions = tree.action[edges]
+        visits = tree.N[edges]
 
         if temp == 0:
             # Exploitation, recommend the action that has the highest visit count
             # TODO: (debugging) actions seem to be clustered to only a few
             #explored = list(np.where(np.array(visits) > 0)[0])
-            #print "Player {}:\t {}".format(self.root.cur_player, explored)
+            #print "Player {}:\t {}".format(tree.cur_player[tree.root], explored)
             #for a in explored:
-                #n = self.root.child[actions[a]]
-                #print "\t{}\t{}\t{}\t{}".format(actions[a], n.N, n.Q, n.P)
+                #e = edges.start + a
+                #print "\t{}\t{}\t{}\t{}".format(actions[a], tree.N[e], tree.get_q(e), tree.P[e])
             # end debug code
             probs = np.zeros(len(visits), dtype=np.float32)
             probs[np.argmax(visits)] = 1.0
             actions, probs = self.restore_action_matrix(actions, probs)
         else:
             # Exploration, assign some probability to less visited child nodes
-            probs = np.array(visits, dtype=np.float32)**(1. / temp)
+            probs = visits.astype(np.float32)**(1. / temp)
             actions, probs = self.restore_action_matrix(actions, probs)
 
         return action_type, actions, probs
@@ -203,13 +459,8 @@ class MCTS(object):
     def restore_action_matrix(self, actions, probs):
         # Returns lists of actions and their corresponding probabilities for all 
         # actions of the current action type. Invalid actions will have 0 probability.
-        if self.root.action_type == 'PUT':
-            probs_full = np.zeros(self.game.get_placement_action_shape())
-        else:
-            probs_full = np.zeros(self.game.get_capture_action_shape())
-
-        for index, p in zip(actions, probs):
-            probs_full[index] = p
+        probs_full = np.zeros(self.get_action_shape(self.tree.get_action_type(self.tree.root)))
+        probs_full.flat[actions] = probs
 
         z, y, x = probs_full.shape
         actions_full = [(i, j, k) for i in xrange(z) for j in xrange(y) for k in xrange(x)]
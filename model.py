@@ -79,8 +79,15 @@ class NNetWrapper(object):
         
 
     def predict(self, states, is_put):
+        return self.predict_batch(np.expand_dims(states, axis=0))
 
-        pi, v = self.nnet.model.predict([np.expand_dims(states, axis=0)])
+    def predict_batch(self, states):
+        '''
+        :param states: (num_states, state_depth, board_x, board_y) batch of states such as the
+                       states of a BatchBoard (see BatchBoard.get_states)
+        :return: placement policies, capture policies and values for every state
+        '''
+        pi, v = self.nnet.model.predict([states])
 
         put_pi_size = self.game.get_placement_action_shape()
         capture_pi_size = self.game.get_capture_action_shape()
@@ -30,9 +30,11 @@ class Coach(object):
             self.prev_model.load_checkpoint(filename='temp.pth.tar')
 
             # Step 2. Training the model
-            prev_mcts = MCTS(self.game, self.prev_model, self.config.c_puct, self.config.num_sims)
+            prev_mcts = MCTS(self.game, self.prev_model, self.config.c_puct,
+                             self.config.num_sims, self.config.sim_batch_size)
             self.model.train(examples)
-            new_mcts = MCTS(self.game, self.model, self.config.c_puct, self.config.num_sims)
+            new_mcts = MCTS(self.game, self.model, self.config.c_puct,
+                            self.config.num_sims, self.config.sim_batch_size)
 
             # Step 3. Evaluate the model
             print 'PITTING AGAINST PREVIOUS VERSION'
@@ -50,14 +52,26 @@ class Coach(object):
                 self.model.load_checkpoint(filename='temp.pth.tar')
 
     def examples_to_array(self, list_of_examples):
-        np_board = np.array([ne[0] for ne in list_of_examples])
-        np_pi_put = np.array([ne[1] for ne in list_of_examples])
-        np_pi_cap = np.array([ne[2] for ne in list_of_examples])
-
-        np_pi = np.concatenate((np_pi_put, np_pi_cap), axis=1)
+        # Rebuild the full states from the packed states and their symmetries
+        np_board = np.array([self.game.get_symmetry(ne[0][1], self.game.unpack_state(ne[0][0]))
+                             for ne in list_of_examples])
+
+        # Fill in the dense placement and capture policies from the sparse policies and translate
+        # them by the symmetry of the example
+        put_size = self.game.get_placement_action_size()
+        cap_size = self.game.get_capture_action_size()
+        np_pi = np.zeros((len(list_of_examples), put_size + cap_size), dtype=np.float32)
+        for i, ne in enumerate(list_of_examples):
+            symmetry_type = ne[0][1]
+            action_type, policy_actions, policy_probs = ne[1]
+            if action_type == 'PUT':
+                pi = np_pi[i, :put_size]
+            else:
+                pi = np_pi[i, put_size:]
+            pi[policy_actions] = policy_probs
+            pi[:] = self.game.translate_action_symmetry(action_type, symmetry_type, pi).ravel()
 
-        np_v = np.array([ne[3] for ne in list_of_examples])
-        np_mask = np.array([ne[4] for ne in list_of_examples])
+        np_v = np.array([ne[2] for ne in list_of_examples])
         return (np_board, np_pi, np_v)
 
     def shuffle_examples(self, examples):
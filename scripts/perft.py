@@ -0,0 +1,116 @@
+'''
+Perft (performance test) for the zertz move generator. Walks the full tree of legal actions to a
+fixed depth and counts the leaves, which measures the raw speed of an engine and gives node counts
+that any other engine (or a faster version of one) has to reproduce exactly.
+
+Usage: python -m scripts.perft [--depth D] [--rings R ...] [--engine numpy|bitboard]
+                               [--position "PUT w D4 A1; CAP b C3 g C5"]
+'''
+
+import argparse
+import time
+
+from zertz.ZertzGame import ZertzGame
+
+
+def new_counts():
+    '''
+    Returns a dictionary of counters for perft:
+        nodes: every position visited below the root (one per action taken)
+        leaves: positions at the full depth
+        PUT, CAP: leaves reached with a placement or a capture action
+        ISO: leaves reached with a placement that captured an isolated region (also counted in PUT)
+        ended: positions where the game was over before the full depth (they are not expanded)
+    '''
+    return {'nodes': 0, 'leaves': 0, 'PUT': 0, 'CAP': 0, 'ISO': 0, 'ended': 0}
+
+
+def load_position(game, position):
+    '''
+    Plays a position string on the game. The position is a list of actions from the start of the
+    game in the format of ZertzGame.str_to_action separated by semicolons.
+    '''
+    for action_str in position.split(';'):
+        if not action_str.strip():
+            continue
+        action_type, action = game.str_to_action(action_str.strip())
+        if action is None:
+            raise ValueError('Invalid action: {}'.format(action_str))
+        game.get_next_state(action, action_type)
+
+
+def perft(game, depth, counts=None):
+    '''
+    Counts the leaves of the tree of legal actions from the current position of the game to depth.
+    Actions are taken with make_move and undone with unmake_move so the game is unchanged after.
+    Each action is one ply, including each jump of a chain capture.
+    :return: the counters from new_counts
+    '''
+    if counts is None:
+        counts = new_counts()
+    if depth == 0:
+        return counts
+    action_type, actions = game.get_legal_actions()
+    if action_type == 'PUT':
+        shape = game.get_placement_action_shape()
+    else:
+        shape = game.get_capture_action_shape()
+    # A placement that removes more rings than the ring it chose to remove has captured an
+    # isolated region. The captured marbles can't be used to tell since the placed marble may
+    # come from the player's own captured marbles when the supply is empty.
+    rings = game.board.get_num_rings()
+    for flat in actions.tolist():
+        action = divmod_action(flat, shape)
+        undo = game.make_move(action, action_type)
+        counts['nodes'] += 1
+        if depth == 1:
+            counts['leaves'] += 1
+            counts[action_type] += 1
+            if action_type == 'PUT':
+                removed = 0 if action[2] == shape[2] - 1 else 1
+                if rings - game.board.get_num_rings() > removed:
+                    counts['ISO'] += 1
+        elif game.get_game_ended() != 0:
+            counts['ended'] += 1
+        else:
+            perft(game, depth - 1, counts)
+        game.unmake_move(undo)
+    return counts
+
+
+def divmod_action(flat, shape):
+    '''
+    Returns the action tuple of a flat action index, the same as np.unravel_index for 3D shapes
+    but without the overhead of numpy for a single index
+    '''
+    rest, last = divmod(flat, shape[2])
+    first, middle = divmod(rest, shape[1])
+    return (first, middle, last)
+
+
+def run(rings, depth, engine='numpy', position=''):
+    '''
+    Runs perft on a new game and prints the counts and the nodes per second
+    '''
+    game = ZertzGame(rings, engine=engine)
+    load_position(game, position)
+    start = time.time()
+    counts = perft(game, depth)
+    elapsed = max(time.time() - start, 1e-9)
+    print '{:>5} rings  depth {}  leaves {:>10}  PUT {:>10}  CAP {:>8}  ISO {:>8}  ended {:>6}  ' \
+          'nodes {:>10}  {:>9.0f} nodes/s'.format(
+              rings, depth, counts['leaves'], counts['PUT'], counts['CAP'], counts['ISO'],
+              counts['ended'], counts['nodes'], counts['nodes'] / elapsed)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count the leaves of the zertz move tree.')
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--rings', type=int, nargs='+', default=[19, 37, 61])
+    parser.add_argument('--engine', default='numpy', choices=sorted(ZertzGame._ENGINES))
+    parser.add_argument('--position', default='',
+                        help='actions from the start of the game separated by semicolons')
+    args = parser.parse_args()
+    for rings in args.rings:
+        run(rings, args.depth, args.engine, args.position)
@@ -9,7 +9,8 @@ class SelfPlay(object):
     def __init__(self, game, nnet):
         self.game = deepcopy(game)
         self.nnet = nnet
-        self.mcts = MCTS(self.game, self.nnet, Config.c_puct, Config.num_sims)
+        self.mcts = MCTS(self.game, self.nnet, Config.c_puct, Config.num_sims,
+                         Config.sim_batch_size)
         self.temp_threshold = Config.temp_threshold
         self.use_dirichlet = Config.use_dirichlet
 
@@ -17,31 +18,31 @@ class SelfPlay(object):
         examples = []
         self.game.reset_board()     
         episode_step = 0
-        null_cap_pi = np.zeros(self.game.get_capture_action_size())
-        null_put_pi = np.zeros(self.game.get_placement_action_size())
         board_state, player_value = self.game.get_current_state()
+        packed_state = None
 
         while True:
             # Generate example and add it to the queue
             episode_step += 1
             temp = max(self.temp_threshold - episode_step, 0)
             action_type, actions, probs = self.mcts.get_action_prob(board_state, temp=temp)
-            examples.append([board_state, action_type, probs, player_value])
+            # Store the state packed with a reference to the previous position of the episode and
+            # the policy as the flat indices and probabilities of the actions it can select
+            packed_state = self.game.pack_state(packed_state, board_state)
+            policy_actions = np.flatnonzero(probs).astype(np.int32)
+            policy = (action_type, policy_actions, probs[policy_actions].astype(np.float32))
+            examples.append([packed_state, policy, player_value])
 
             # Select an action at random and update the game and MC search tree
             probs /= sum(probs)
             if self.use_dirichlet:
-                valid_placement, valid_capture = self.game.get_valid_actions(board_state)
-                if action_type == 'PUT':
-                    dir_alpha = 1.0/np.sum(valid_placement)
-                    dirichlet_probs = np.random.dirichlet(dir_alpha*np.ones(len(probs)))
-                    valid_placement = valid_placement.flatten()
-                    dirichlet_probs *= valid_placement
-                else:
-                    dir_alpha = 1.0/np.sum(valid_capture)
-                    dirichlet_probs = np.random.dirichlet(dir_alpha*np.ones(len(probs)))
-                    valid_capture = valid_capture.flatten()
-                    dirichlet_probs *= valid_capture
+                # Add noise to the probabilities of the legal actions of the action type
+                _, legal_actions = self.game.legal(board_state)
+                dir_alpha = 1.0/len(legal_actions)
+                dirichlet_probs = np.random.dirichlet(dir_alpha*np.ones(len(probs)))
+                valid = np.zeros(len(probs))
+                valid[legal_actions] = 1
+                dirichlet_probs *= valid
                 dirichlet_probs /= np.sum(dirichlet_probs)
                 action = actions[np.random.choice(np.arange(len(actions)), p=0.75*probs + 0.25*dirichlet_probs)]
             else:
@@ -49,7 +50,7 @@ class SelfPlay(object):
 
             board_state, player_value = self.game.get_next_state(action, action_type)
             self.mcts.move_root(action, player_value)
-            winner = self.game.get_game_ended(board_state)
+            winner = self.game.terminal(board_state)
 
             if winner != 0 or episode_step > 200:
                 # Once winner is known, update each example with value based on the current player
@@ -57,40 +58,16 @@ class SelfPlay(object):
                 # TODO: clean this up...
                 new_examples = []
                 for e in examples:
-                    state = e[0]
-                    v = winner * e[3]
-                    if e[1] == 'PUT':
-                        p_placement = e[2]
-                        p_capture = null_cap_pi
-                        action_type = 1
-                    else:
-                        p_placement = null_put_pi
-                        p_capture = e[2]
-                        action_type = 0
-                    new_examples.append((state, p_placement, p_capture, v, action_type))
-
-                    # Add opponent symmetry
-                    opponent_state = np.copy(state)
-                    opponent_state[-1] = (opponent_state[-1] - 1) * -1
-                    new_examples.append((opponent_state, p_placement, p_capture, -v, action_type))
-
-                    # Add other symmetries
-                    for symmetry_type, state in self.game.get_symmetries(e[0]):
-                        if e[1] == 'PUT':
-                            p_placement = self.game.translate_action_symmetry(
-                                    e[1], symmetry_type, e[2]).flatten()
-                            p_capture = null_cap_pi
-                            action_type = 1
-                        else:
-                            p_placement = null_put_pi
-                            p_capture = self.game.translate_action_symmetry(
-                                    e[1], symmetry_type, e[2]).flatten()
-                            action_type = 0
-                        new_examples.append((state, p_placement, p_capture, v, action_type))
-
-                        opponent_state = np.copy(state)
-                        opponent_state[-1] = (opponent_state[-1] - 1) * -1
-                        new_examples.append((opponent_state, p_placement, p_capture, -v, action_type))
+                    v = winner * e[2]
+
+                    # Add the example with every symmetry, starting with the original (symmetry 0)
+                    # and including the symmetries with the players swapped. The packed state and
+                    # the sparse policy are shared by every symmetry and are only rebuilt and
+                    # translated when the examples are converted to arrays for training (see
+                    # Coach.examples_to_array).
+                    for symmetry_type in xrange(self.game.get_num_symmetries()):
+                        symmetry_v = self.game.translate_value_symmetry(symmetry_type, v)
+                        new_examples.append(((e[0], symmetry_type), e[1], symmetry_v))
                         
                 return new_examples   
 
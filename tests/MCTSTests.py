@@ -3,7 +3,7 @@ sys.path.append('.')
 import unittest
 import numpy as np
 
-from mcts import Node, MCTS
+from mcts import Tree, MCTS
 from zertz.ZertzGame import ZertzGame as Game
 
 class DumbNN(object):
@@ -22,6 +22,86 @@ class DumbNN(object):
             capture = capture.astype(np.float32) / np.sum(capture)
         return placement, capture, v
 
+    def predict_batch(self, board_states):
+        predictions = [self.predict(board_state, None) for board_state in board_states]
+        placement, capture, v = zip(*predictions)
+        return np.array(placement), np.array(capture), np.array(v)
+
+class TestTree(unittest.TestCase):
+    def test_tree(self):
+        # Small chunks so that the arrays have to grow
+        tree = Tree(1, chunk=4)
+        self.assertTrue(tree.is_leaf(tree.root))
+        tree.expand(tree.root, 'PUT', np.array([3, 5, 7, 9, 11]),
+                    np.array([0.1, 0.0, 0.2, 0.3, 0.4]))
+        # The action with no probability is not added
+        edges = tree.get_edges(tree.root)
+        self.assertEqual(list(tree.action[edges]), [3, 7, 9, 11])
+        self.assertEqual(tree.get_action_type(tree.root), 'PUT')
+        # Before any visits the edge with the largest prior is selected
+        tree.N[0] = 1
+        tree.start_path()
+        edge = tree.select(tree.root, 1)
+        self.assertEqual(tree.action[edge], 11)
+        # Child nodes are only created when they are first needed
+        self.assertEqual(tree.num_nodes, 1)
+        self.assertTrue(np.all(tree.child[edges] == -1))
+        child = tree.get_child(edge)
+        self.assertEqual(tree.get_child(edge), child)
+        self.assertEqual(tree.num_nodes, 2)
+        tree.cur_player[child] = -1
+        tree.expand(child, 'CAP', np.array([0, 1]), np.array([0.5, 0.5]))
+        # Ties go to the first edge
+        first = tree.select(child, 1)
+        self.assertEqual(first, tree.first_edge[child])
+        self.assertEqual(list(tree.path[:tree.path_length]), [0, edge, first])
+        tree.backup(0.5)
+        # The next simulation takes the same edge from the root and then the other edge
+        tree.start_path()
+        self.assertEqual(tree.select(tree.root, 1), edge)
+        second = tree.select(child, 1)
+        self.assertEqual(second, first + 1)
+        tree.get_child(second)
+        tree.backup(-1.0)
+        self.assertEqual(tree.N[0], 3)
+        self.assertEqual(tree.N[edge], 2)
+        self.assertAlmostEqual(tree.get_q(edge), -0.25)
+        # Moving the root keeps only the subtree with its statistics
+        tree.set_root(child)
+        self.assertEqual(tree.num_nodes, 2)
+        self.assertEqual(tree.num_edges_used, 3)
+        self.assertEqual(tree.N[0], 2)
+        self.assertEqual(tree.cur_player[tree.root], -1)
+        self.assertEqual(tree.get_action_type(tree.root), 'CAP')
+        edges = tree.get_edges(tree.root)
+        self.assertEqual(list(tree.action[edges]), [0, 1])
+        self.assertEqual(list(tree.N[edges]), [1, 1])
+        self.assertEqual(list(tree.parent[edges]), [0, 0])
+        self.assertEqual(tree.child[edges.start], -1)
+        self.assertEqual(tree.parent_edge[tree.child[edges.start + 1]], edges.start + 1)
+
+    def test_virtual_loss(self):
+        tree = Tree(1)
+        tree.expand(tree.root, 'PUT', np.array([0, 1]), np.array([0.5, 0.5]))
+        tree.N[0] = 1
+        tree.start_path()
+        edge = tree.select(tree.root, 1)
+        self.assertEqual(edge, tree.first_edge[tree.root])
+        path = tree.path[:tree.path_length].copy()
+        tree.add_virtual_loss(path)
+        # The edge looks lost for player 1 so the next path takes the other edge
+        self.assertEqual(tree.N[0], 2)
+        self.assertEqual(tree.N[edge], 1)
+        self.assertEqual(tree.get_q(edge), -1.0)
+        tree.start_path()
+        self.assertEqual(tree.select(tree.root, 1), edge + 1)
+        # Removing the virtual loss and backing up the saved path leaves only the real visit
+        tree.remove_virtual_loss(path)
+        tree.backup(0.25, path)
+        self.assertEqual(tree.N[0], 2)
+        self.assertEqual(tree.N[edge], 1)
+        self.assertEqual(tree.get_q(edge), 0.25)
+
 class TestMCTS(unittest.TestCase):
     def test_mcts(self):
         # set up
@@ -87,6 +167,42 @@ class TestMCTS(unittest.TestCase):
         ai.reset(player_value)
         ai.get_action_prob(board_state, temp=0)
 
+    def test_value_convention(self):
+        # The network value is for the player to move and is stored for the first player
+        game = Game(19)
+        nnet = DumbNN(game)
+        predict = nnet.predict
+        nnet.predict = lambda state, action_filter: predict(state, action_filter)[:2] + (0.5,)
+        ai = MCTS(game, nnet, 1, 2)
+        ai.reset(1)
+        board_state, _ = game.get_current_state()
+        ai.get_action_prob(board_state, temp=1)
+        tree = ai.tree
+        self.assertAlmostEqual(tree.W[0], 0.0)
+        edge = tree.parent_edge[1]
+        self.assertEqual(tree.cur_player[1], -1)
+        self.assertAlmostEqual(tree.W[edge], -0.5)
+
+    def test_simulate_batch(self):
+        game = Game(19)
+        nnet = DumbNN(game)
+        board_state, player_value = game.get_current_state()
+        ai = MCTS(game, nnet, 1, 50, batch_size=8)
+        ai.reset(player_value)
+        action_type, actions, probs = ai.get_action_prob(board_state, temp=1)
+        # Every simulation is counted once and no virtual loss is left in the tree
+        tree = ai.tree
+        edges = tree.get_edges(tree.root)
+        self.assertEqual(tree.N[0], 50)
+        self.assertEqual(np.sum(tree.N[edges]), 49)
+        used = slice(1, tree.num_edges_used)
+        self.assertTrue(np.all(tree.N[used] >= 0))
+        self.assertTrue(np.all(np.abs(tree.get_q(used)) <= 1))
+        # The first batch only has the root, the paths of the other batches are spread out
+        self.assertTrue(np.count_nonzero(tree.N[edges]) > 1)
+        self.assertEqual(action_type, 'PUT')
+        self.assertAlmostEqual(np.sum(probs), 1)
+
 if __name__ == '__main__':
     unittest.main()
 
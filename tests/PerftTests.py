@@ -0,0 +1,62 @@
+import sys
+sys.path.append('.')
+import unittest
+
+from scripts.perft import perft, load_position
+from zertz.ZertzGame import ZertzGame
+
+# Position on 19 rings where some placements isolate a region
+ISOLATION_POSITION = 'PUT w D1 B4; PUT b E2 A2; PUT b A3 A1; PUT g E3 B2; CAP g E3 b E1; CAP g E1 w C1'
+# Position on 19 rings with 2 marbles of each color where the supply is empty, so the placed marble
+# comes from the captured marbles, and PUT b E3 D3 isolates a region with a single marble
+EMPTY_SUPPLY_MARBLES = {'w': 2, 'g': 2, 'b': 2}
+EMPTY_SUPPLY_POSITION = 'PUT w A2 A1; PUT g C3 E1; PUT w E3 B1; PUT b D4 E2; CAP w E3 b C5; ' \
+                        'PUT b D3 B4; CAP g C3 b E3; PUT g A3 D4; PUT b D3 D2; CAP g E3 b C3'
+
+
+class TestPerft(unittest.TestCase):
+    engine = 'numpy'
+
+    def perft(self, rings, depth, position='', marbles=None):
+        game = ZertzGame(rings, marbles, engine=self.engine)
+        load_position(game, position)
+        state = game.board.state
+        counts = perft(game, depth)
+        # The game is back at the starting position after the search
+        self.assertTrue((game.board.state == state).all())
+        return counts
+
+    def test_start(self):
+        self.assertEqual(self.perft(19, 1)['leaves'], 648)
+        self.assertEqual(self.perft(37, 1)['leaves'], 1944)
+        self.assertEqual(self.perft(61, 1)['leaves'], 4320)
+        counts = self.perft(7, 2)
+        self.assertEqual(counts['leaves'], 5400)
+        self.assertEqual(counts['nodes'], 5508)
+
+    def test_position(self):
+        counts = self.perft(19, 1, ISOLATION_POSITION)
+        self.assertEqual(counts['leaves'], 288)
+        self.assertEqual(counts['ISO'], 36)
+        counts = self.perft(19, 2, ISOLATION_POSITION)
+        self.assertEqual(counts['leaves'], 46593)
+        self.assertEqual(counts['PUT'], 46530)
+        self.assertEqual(counts['CAP'], 63)
+        self.assertEqual(counts['ISO'], 5850)
+
+    def test_empty_supply(self):
+        counts = self.perft(19, 1, EMPTY_SUPPLY_POSITION, EMPTY_SUPPLY_MARBLES)
+        self.assertEqual(counts['leaves'], 35)
+        self.assertEqual(counts['ISO'], 1)
+        counts = self.perft(19, 2, EMPTY_SUPPLY_POSITION, EMPTY_SUPPLY_MARBLES)
+        self.assertEqual(counts['leaves'], 262)
+        self.assertEqual(counts['CAP'], 32)
+        self.assertEqual(counts['ISO'], 52)
+
+
+class TestPerftBitBoard(TestPerft):
+    engine = 'bitboard'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,59 @@
 import sys
 sys.path.append('.')
+import pickle
 import unittest
 import numpy as np
 
 from zertz.ZertzLogic import Board
+from zertz.ZertzBitBoard import BitBoard
 from zertz.ZertzGame import ZertzGame
 
 
+def action_shape(game, action_type):
+    # Return the shape of the placement or capture action matrix of a Board or ZertzGame
+    if isinstance(game, ZertzGame):
+        if action_type == 'PUT':
+            return game.get_placement_action_shape()
+        return game.get_capture_action_shape()
+    if action_type == 'PUT':
+        return game.get_placement_shape()
+    return game.get_capture_shape()
+
+def random_action(game, rng):
+    # Return a random legal (action_type, action) of a Board or ZertzGame or None if there are no
+    # legal actions
+    action_type, actions = game.get_legal_actions()
+    if len(actions) == 0:
+        return None
+    flat = actions[rng.randint(len(actions))]
+    return action_type, np.unravel_index(flat, action_shape(game, action_type))
+
+def play_random_moves(game, rng, num_moves=None, move=None):
+    # Play random legal actions on a Board or ZertzGame until there are no legal actions, the
+    # board is full (Board) or the game has ended (ZertzGame), or num_moves actions were played.
+    # Each action is taken with move(action, action_type), by default take_action for a Board and
+    # get_next_state for a ZertzGame, and (action_type, action, result of move) is yielded after.
+    is_game = isinstance(game, ZertzGame)
+    if move is None:
+        move = game.get_next_state if is_game else game.take_action
+    played = 0
+    while num_moves is None or played < num_moves:
+        if (game.get_game_ended() != 0) if is_game else game.is_full():
+            return
+        chosen = random_action(game, rng)
+        if chosen is None:
+            return
+        action_type, action = chosen
+        result = move(action, action_type)
+        played += 1
+        yield action_type, action, result
+
+
 class TestZertzLogic(unittest.TestCase):
+    Board = Board
+
     def test_init(self):
-        board = Board(37)
+        board = self.Board(37)
         self.assertEqual(board.width, 7)
         self.assertEqual(board.rings, 37)
         self.assertEqual(np.sum(board.state[0]), 37)
@@ -18,12 +62,12 @@ class TestZertzLogic(unittest.TestCase):
         self.assertTrue(np.all(board.state[6] == 8))
         self.assertTrue(np.all(board.state[7] == 10))
         self.assertEqual(np.sum(board.state), 1213)
-        board = Board(37, t=7)
+        board = self.Board(37, t=7)
         self.assertEqual(board.state.shape[0], 39)
         self.assertEqual(np.sum(board.state), 1213)
 
     def test_removable(self):
-        board = Board(19)
+        board = self.Board(19)
         self.assertTrue(board._is_removable((0, 0)))
         self.assertTrue(board._is_removable((0, 1)))
         self.assertTrue(board._is_removable((0, 2)))
@@ -33,23 +77,60 @@ class TestZertzLogic(unittest.TestCase):
         self.assertFalse(board._is_removable((1, 1)))
         self.assertFalse(board._is_removable((2, 2)))
 
+    def test_removable_rings(self):
+        # Check every removable ring during a random game by walking around its neighbors
+        rng = np.random.RandomState(6)
+        board = self.Board(37)
+        width = board.width
+        def check_removable():
+            rings = board.state[0]
+            empty = np.sum(board.state[0:4], axis=0) == 1
+            expected = []
+            for y in range(width):
+                for x in range(width):
+                    missing = [not (0 <= y + dy < width and 0 <= x + dx < width)
+                               or rings[y + dy, x + dx] == 0 for dy, dx in board._DIRECTIONS]
+                    if empty[y, x] and any(missing[d] and missing[d - 1] for d in range(6)):
+                        expected.append((y, x))
+            self.assertEqual(sorted(board._get_removable_rings()), expected)
+            self.assertTrue(np.all(board._get_placement_masks()[1] == empty.ravel()))
+        check_removable()
+        for _ in play_random_moves(board, rng):
+            check_removable()
+
     def test_neighbors(self):
-        board = Board(19)
+        board = self.Board(19)
         center = (2, 2)
         neighbors = [(3,2), (2,1), (1,1), (1,2), (2,3), (3,3)]
         for index in board._get_neighbors(center):
             self.assertTrue(index in neighbors)
 
     def test_jump_dst(self):
-        board = Board(19)
+        board = self.Board(19)
         center = (2, 2)
         destinations = [(4,2), (2,0), (0,0), (0,2), (2,4), (4,4)]
         for index in board._get_neighbors(center):
             dst = board._get_jump_dst(center, index)
             self.assertTrue(dst in destinations)
 
+    def test_tables(self):
+        board = self.Board(19)
+        center = 2 * 5 + 2
+        neighbors = [(3,2), (2,1), (1,1), (1,2), (2,3), (3,3)]
+        destinations = [(4,2), (2,0), (0,0), (0,2), (2,4), (4,4)]
+        for direction in xrange(6):
+            y, x = neighbors[direction]
+            self.assertEqual(board._neighbor_table[center, direction], y * 5 + x)
+            y, x = destinations[direction]
+            self.assertEqual(board._jump_table[center, direction], y * 5 + x)
+        # Locations off the edge of the array map to the padding index
+        self.assertEqual(board._neighbor_table[0, 1], 25)
+        self.assertEqual(board._jump_table[5, 3], 25)
+        # Tables are shared by every board of the same size
+        self.assertTrue(board._neighbor_table is self.Board(19)._neighbor_table)
+
     def test_get_middle(self):
-        board = Board(19)
+        board = self.Board(19)
         center = (2, 2)
         destinations = [(4,2), (2,0), (0,0), (0,2), (2,4), (4,4)]
         middles = [(3,2), (2,1), (1,1), (1,2), (2,3), (3,3)]
@@ -57,7 +138,7 @@ class TestZertzLogic(unittest.TestCase):
             self.assertTrue(mid == board._get_middle_ring(center, dst))
 
     def test_put_action(self):
-        board = Board(19, t=2)
+        board = self.Board(19, t=2)
         #(('PUT', 'w', (4, 4)), ('REM', (4, 3)))
         board.take_action((0, 24, 23), 'PUT')
         self.assertEqual(board.state[18, 0, 0], 1)
@@ -74,8 +155,97 @@ class TestZertzLogic(unittest.TestCase):
         self.assertEqual(board.state[4, 4, 3], 0)
         self.assertTrue(board._is_removable((3, 2)))
 
+    def test_history(self):
+        board = self.Board(19, t=3)
+        states = [board.state]
+        for action in [(0, 24, 23), (2, 19, 22), (1, 12, 25), (0, 6, 25)]:
+            board.take_action(action, 'PUT')
+            states.append(board.state)
+        # The ring and marble layers of the last t states are stacked from most recent to oldest
+        # with zeros for steps before the start of the game
+        for i in range(len(states)):
+            for step in range(3):
+                past = states[i - step][0:4] if i >= step else np.zeros_like(states[0][0:4])
+                self.assertTrue(np.array_equal(states[i][4 * step: 4 * step + 4], past))
+        # Loading a state and writing the state into a buffer
+        clone = self.Board(19, t=3)
+        clone.state = states[-1]
+        out = np.full((2,) + states[-1].shape, 255, dtype=np.uint8)
+        clone.get_state(out=out[1])
+        self.assertTrue(np.array_equal(out[1], states[-1]))
+        self.assertTrue(np.all(out[0] == 255))
+
+    def test_supply_counters(self):
+        board = self.Board(19, t=2)
+        board.take_action((0, 24, 23), 'PUT')
+        clone = self.Board(clone=board)
+        clone.take_action((2, 19, 22), 'PUT')
+        # The supply and player are kept as integers and broadcast to full layers in the state
+        self.assertEqual(list(board.supply), [5, 8, 10, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(list(clone.supply), [5, 8, 9, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(board.get_cur_player(), 1)
+        self.assertEqual(clone.get_cur_player(), 0)
+        state = clone.state
+        for layer, count in zip(range(9, 18), clone.supply):
+            self.assertTrue(np.all(state[layer] == count))
+        self.assertTrue(np.all(state[18] == 0))
+        # Loading the state restores the counters
+        board.state = state
+        self.assertEqual(list(board.supply), list(clone.supply))
+        self.assertEqual(board.get_cur_player(), 0)
+
+    def test_hash(self):
+        # The hash is updated with each action and matches the hash computed from scratch
+        rng = np.random.RandomState(2)
+        board = self.Board(19)
+        hashes = set([board.get_hash()])
+        for _ in play_random_moves(board, rng):
+            self.assertEqual(board.get_hash(), board._compute_hash())
+            self.assertTrue(board.get_hash() not in hashes)
+            hashes.add(board.get_hash())
+        # The same position reached with a different order of actions has the same hash
+        first = self.Board(19)
+        second = self.Board(19)
+        for action in [(0, 24, 23), (2, 19, 22), (1, 12, 25), (0, 6, 25)]:
+            first.take_action(action, 'PUT')
+        for action in [(1, 12, 25), (2, 19, 22), (0, 24, 23), (0, 6, 25)]:
+            second.take_action(action, 'PUT')
+        self.assertTrue(np.all(first.state == second.state))
+        self.assertEqual(first.get_hash(), second.get_hash())
+
+    def test_make_unmake(self):
+        # Every legal move of a random game is made and undone before the game continues with a
+        # copy that only takes actions. The boards must stay the same after every move.
+        rng = np.random.RandomState(3)
+        board = self.Board(19, t=2)
+        played = self.Board(19, t=2)
+        def check_moves():
+            action_type, actions = board.get_legal_actions()
+            state = board.state
+            value = board.get_hash()
+            for flat in actions[:20]:
+                action = np.unravel_index(flat, action_shape(board, action_type))
+                board.unmake_move(board.make_move(action, action_type))
+                self.assertTrue(np.all(board.state == state))
+                self.assertEqual(board.get_hash(), value)
+            return state
+        undo = []
+        state = check_moves()
+        for action_type, action, record in play_random_moves(board, rng, move=board.make_move):
+            undo.append((record, state))
+            played.take_action(action, action_type)
+            self.assertTrue(np.all(board.state == played.state))
+            self.assertEqual(board.get_legal_actions()[0], played.get_legal_actions()[0])
+            self.assertTrue(np.all(board.get_legal_actions()[1] == played.get_legal_actions()[1]))
+            state = check_moves()
+        # Undo the whole game back to the start
+        for record, state in reversed(undo):
+            board.unmake_move(record)
+            self.assertTrue(np.all(board.state == state))
+        self.assertTrue(np.all(board.state == self.Board(19, t=2).state))
+
     def test_get_capture_moves(self):
-        board = Board(19)
+        board = self.Board(19)
         #(('PUT', 'w', (4, 4)), ('REM', (4, 3)))
         board.take_action((0, 24, 23), 'PUT')
         #(('PUT', 'b', (3, 4)), ('REM', (4, 2)))
@@ -114,9 +284,25 @@ class TestZertzLogic(unittest.TestCase):
         self.assertTrue(np.all(placement == False))
         self.assertTrue(np.all(test_actions == capture))
 
+    def test_legal_actions(self):
+        rng = np.random.RandomState(1)
+        board = self.Board(19)
+        def check_legal():
+            placement, capture = board.get_valid_moves()
+            action_type, actions = board.get_legal_actions()
+            if np.any(capture):
+                self.assertEqual(action_type, 'CAP')
+                self.assertTrue(np.all(actions == np.flatnonzero(capture)))
+            else:
+                self.assertEqual(action_type, 'PUT')
+                self.assertTrue(np.all(actions == np.flatnonzero(placement)))
+        check_legal()
+        for _ in play_random_moves(board, rng):
+            check_legal()
+
     def test_separated_board_simple(self):
         # Captured black marble goes to player 1
-        board = Board(19)
+        board = self.Board(19)
         #(('PUT', 'b', (0, 0)), ('REM', (3, 1)))
         board.take_action((2, 0, 16), 'PUT')
         #(('PUT', 'b', (0, 2)), ('REM', (2, 0)))
@@ -133,7 +319,7 @@ class TestZertzLogic(unittest.TestCase):
         self.assertEqual(board.state[10, 0, 0], 1)
         self.assertEqual(board.state[13, 0, 0], 0)
         # Captured black marble goes to player 2
-        board = Board(19)
+        board = self.Board(19)
         #(('PUT', 'b', (0, 0)), ('REM', (3, 1)))
         board.take_action((2, 0, 16), 'PUT')
         #(('PUT', 'b', (0, 2)), ('REM', (2, 0)))
@@ -153,7 +339,7 @@ class TestZertzLogic(unittest.TestCase):
         self.assertEqual(board.state[13, 0, 0], 1)
 
     def test_separated_board_complex(self):
-        board = Board(19)
+        board = self.Board(19)
         #(('PUT', 'b', (0, 0)), ('REM', (3, 1)))
         board.take_action((2, 0, 16), 'PUT')
         #(('PUT', 'b', (0, 2)), ('REM', (2, 0)))
@@ -187,25 +373,94 @@ class TestZertzLogic(unittest.TestCase):
         self.assertEqual(board.state[8, 0, 0], 0)
         self.assertEqual(board.state[11, 0, 0], 2)
 
+    def test_separated_board_filled(self):
+        board = self.Board(19)
+        for action in [(2, 0, 16), (2, 2, 10), (2, 14, 11), (0, 22, 17), (2, 12, 24), (2, 8, 19)]:
+            board.take_action(action, 'PUT')
+        # Separate the region (4, 2), (4, 3) while (4, 3) is still empty
+        #(('PUT', 'b', (0, 1)), ('REM', (3, 3)))
+        board.take_action((2, 1, 18), 'PUT')
+        self.assertEqual(len(board._get_regions()), 2)
+        # Filling the last empty ring captures the region even though the removed ring is far away
+        #(('PUT', 'w', (4, 3)), ('REM', (2, 3)))
+        board.take_action((0, 23, 13), 'PUT')
+        self.assertEqual(len(board._get_regions()), 1)
+        self.assertEqual(board.state[0, 4, 2], 0)
+        self.assertEqual(board.state[0, 4, 3], 0)
+        self.assertEqual(board.state[11, 0, 0], 2)
+
+    def test_region_tracking(self):
+        board = self.Board(19)
+        for action in [(2, 0, 16), (2, 2, 10), (2, 14, 11), (0, 22, 17), (2, 12, 24), (2, 8, 19)]:
+            board.take_action(action, 'PUT')
+        self.assertEqual(board._region_sizes.values(), [13])
+        self.assertEqual(board._region_empty.values(), [7])
+        # Removing (3, 3) splits off the rings (4, 2) and (4, 3)
+        board.take_action((2, 1, 18), 'PUT')
+        labels = board._get_region_labels()
+        split = labels[4 * 5 + 2]
+        self.assertEqual(labels[4 * 5 + 3], split)
+        self.assertEqual(board._region_sizes[split], 2)
+        self.assertEqual(board._region_empty[split], 1)
+        self.assertEqual(board._region_sizes[labels[0]], 10)
+        self.assertEqual(board._region_empty[labels[0]], 4)
+        # Assigning a state labels the regions again
+        board.state = np.copy(board.state)
+        self.assertEqual(sorted(board._get_region_labels()), sorted(labels))
+        self.assertEqual(sorted(board._region_empty.values()), [1, 4])
+
+    def test_region_labels_kept(self):
+        # The regions are only labeled from scratch once for an assigned state and never while
+        # moves are made and undone
+        rng = np.random.RandomState(4)
+        board = self.Board(37)
+        labelings = []
+        label_regions = board._label_regions
+        def count_labelings():
+            labelings.append(1)
+            label_regions()
+        board._label_regions = count_labelings
+        for state in [None, np.copy(board.state)]:
+            if state is not None:
+                board.state = state
+            for _ in xrange(20):
+                undo = [record for _, _, record in
+                        play_random_moves(board, rng, 10, move=board.make_move)]
+                for record in reversed(undo):
+                    board.unmake_move(record)
+            # Only the assigned state is labeled, by the first move
+            self.assertEqual(len(labelings), 0 if state is None else 1)
+        # The kept labels match labeling the board from scratch
+        labeled = self.Board(37)
+        labeled.state = board.state
+        self.assertEqual(sorted(labeled._get_regions()), sorted(board._get_regions()))
+        self.assertEqual(sorted(labeled._region_empty.values()),
+                         sorted(board._region_empty.values()))
+
     def test_translated_action(self):
-        board = Board(19)
+        board = self.Board(19)
         # Take some actions
         #(('PUT', 'w', (4, 4)), ('REM', (4, 3)))
         board.take_action((0, 24, 23), 'PUT')
         symmetries = board.get_state_symmetries()
+        self.assertEqual(len(symmetries), 24)
         # Test the placement actions
-        for i in xrange(3):
-            symmetry = Board(19)
-            symmetry.state = symmetries[i][1]
+        for i, state in symmetries:
+            symmetry = self.Board(19)
+            symmetry.state = state
             valid_placement = symmetry.get_placement_moves()
-            if i == 0:
+            symmetry_placement = board.translate_action('PUT', i, board.get_placement_moves())
+            self.assertTrue(np.all(valid_placement == symmetry_placement))
+            if i == 6:
                 symmetry_placement = board.mirror_action('PUT', board.get_placement_moves())
-            elif i == 1:
+                self.assertTrue(np.all(valid_placement == symmetry_placement))
+            elif i == 3:
                 symmetry_placement = board.rotate_action('PUT', board.get_placement_moves())
-            elif i == 2:
+                self.assertTrue(np.all(valid_placement == symmetry_placement))
+            elif i == 9:
                 symmetry_placement = board.rotate_action('PUT', board.get_placement_moves())
                 symmetry_placement = board.mirror_action('PUT', symmetry_placement)
-            self.assertTrue(np.all(valid_placement == symmetry_placement))
+                self.assertTrue(np.all(valid_placement == symmetry_placement))
         #(('PUT', 'b', (3, 4)), ('REM', (4, 2)))
         board.take_action((2, 19, 22), 'PUT')
         # Now get the board to a capture state
@@ -219,40 +474,85 @@ class TestZertzLogic(unittest.TestCase):
         board.take_action((0, 18, 0), 'PUT')
         symmetries = board.get_state_symmetries()
         # Test the capture actions
-        for i in xrange(3):
-            symmetry = Board(19)
-            symmetry.state = symmetries[i][1]
+        for i, state in symmetries:
+            symmetry = self.Board(19)
+            symmetry.state = state
             valid_capture = symmetry.get_capture_moves()
-            if i == 0:
-                symmetry_capture = board.mirror_action('CAP', board.get_capture_moves())
-            elif i == 1:
-                symmetry_capture = board.rotate_action('CAP', board.get_capture_moves())
-            elif i == 2:
-                symmetry_capture = board.rotate_action('CAP', board.get_capture_moves())
-                symmetry_capture = board.mirror_action('CAP', symmetry_capture)
+            symmetry_capture = board.translate_action('CAP', i, board.get_capture_moves())
             self.assertTrue(np.all(valid_capture == symmetry_capture))
+            # Actions of the symmetrical state are translated back with the inverse
+            symmetry_capture = board.translate_action('CAP', i, valid_capture, inverse=True)
+            self.assertTrue(np.all(board.get_capture_moves() == symmetry_capture))
+
+    def test_symmetry_tables(self):
+        board = self.Board(37, t=2)
+        board.take_action((0, 24, 23), 'PUT')
+        state = board.state
+        # Mirror transposes every layer and rotate turns every layer 180 degrees
+        self.assertTrue(np.all(board.translate_state(6) == np.transpose(state, (0, 2, 1))))
+        self.assertTrue(np.all(board.translate_state(3) == state[:, ::-1, ::-1]))
+        # The opponent symmetry swaps the captured marbles and the current player
+        state[12] = 2
+        state[15] = 3
+        opponent = board.translate_state(12, state)
+        self.assertTrue(np.all(opponent[:12] == state[:12]))
+        self.assertTrue(np.all(opponent[15] == 2))
+        self.assertTrue(np.all(opponent[12] == 3))
+        self.assertTrue(np.all(opponent[18] == 0))
+        # Every symmetry is undone by its inverse for states and actions
+        rng = np.random.RandomState(4)
+        placement = rng.rand(*board.get_placement_shape())
+        capture = rng.rand(*board.get_capture_shape())
+        for symmetry in xrange(board.get_num_symmetries()):
+            inverse = board.get_inverse_symmetry(symmetry)
+            translated = board.translate_state(inverse, board.translate_state(symmetry, state))
+            self.assertTrue(np.all(translated == state))
+            translated = board.translate_action('PUT', symmetry, placement)
+            translated = board.translate_action('PUT', symmetry, translated, inverse=True)
+            self.assertTrue(np.all(translated == placement))
+            translated = board.translate_action('CAP', symmetry, capture.ravel())
+            self.assertEqual(translated.shape, capture.shape)
+            translated = board.translate_action('CAP', symmetry, translated, inverse=True)
+            self.assertTrue(np.all(translated == capture))
+        # Six rotations of 60 degrees are the identity
+        rotated = state
+        for _ in xrange(6):
+            rotated = board.translate_state(1, rotated)
+            self.assertEqual(np.sum(rotated[0]), 36)
+        self.assertTrue(np.all(rotated == state))
+        # Placements without a ring removal keep the no removal index
+        placement = np.zeros(board.get_placement_shape())
+        placement[1, 1 * 7 + 2, 49] = 1
+        mirrored = board.translate_action('PUT', 6, placement)
+        self.assertEqual(mirrored[1, 2 * 7 + 1, 49], 1)
+        self.assertEqual(np.sum(mirrored), 1)
 
     def test_str_to_index(self):
-        board = Board(37)
+        board = self.Board(37)
         indices = [(3, 0), (0, 0), (1, 1), (4, 2), (4, 3), (3, 6), (6, 6)]
         moves = ['A1', 'A4', 'B4', 'C2', 'D3', 'G4', 'G1']
         for index, move in zip(indices, moves):
             self.assertEqual(index, board.str_to_index(move))
 
     def test_str_to_index(self):
-        board = Board(37)
+        board = self.Board(37)
         indices = [(3, 0), (0, 0), (1, 1), (4, 2), (4, 3), (3, 6), (6, 6)]
         moves = ['A1', 'A4', 'B4', 'C2', 'D3', 'G4', 'G1']
         for index, move in zip(indices, moves):
             self.assertEqual(move, board.index_to_str(index))
 
 class TestZertzGame(unittest.TestCase):
+    engine = 'numpy'
+
+    def ZertzGame(self, *args, **kwargs):
+        return ZertzGame(*args, engine=self.engine, **kwargs)
+
     def test_init(self):
-        game = ZertzGame(19)
+        game = self.ZertzGame(19)
         self.assertEqual(game.initial_rings, 19)
         self.assertEqual(np.sum(game.board.state), 619)
         self.assertEqual(game.board.get_cur_player(), 0)
-        game = ZertzGame(19, {'w': 2, 'g': 2, 'b': 2})
+        game = self.ZertzGame(19, {'w': 2, 'g': 2, 'b': 2})
         self.assertEqual(game.initial_rings, 19)
         self.assertEqual(game.board.state[5, 0, 0], 2)
         self.assertEqual(game.board.state[6, 0, 0], 2)
@@ -260,11 +560,11 @@ class TestZertzGame(unittest.TestCase):
         self.assertEqual(np.sum(game.board.state), 169)
 
     def test_get_actions(self):
-        game = ZertzGame(19)
+        game = self.ZertzGame(19)
         placement, capture = game.get_valid_actions()
         self.assertEqual(np.sum(placement), 648)
         self.assertTrue(np.all(capture == False))
-        game = ZertzGame(37)
+        game = self.ZertzGame(37)
         placement, capture = game.get_valid_actions()
         self.assertEqual(np.sum(placement), 1944)
         self.assertTrue(np.all(capture == False))
@@ -281,14 +581,14 @@ class TestZertzGame(unittest.TestCase):
         placement, capture = game.get_valid_actions()
         self.assertEqual(np.sum(capture), 5)
         self.assertTrue(np.all(placement == False))
-        game = ZertzGame(1)
+        game = self.ZertzGame(1)
         placement, capture = game.get_valid_actions()
         self.assertEqual(np.sum(placement), 3)
         self.assertTrue(np.all(placement[:, :, 1]))
         self.assertTrue(np.all(capture == False))
 
     def test_take_actions(self):
-        game = ZertzGame(19)
+        game = self.ZertzGame(19)
         #(('PUT', 'w', (4, 4)), ('REM', (4, 3)))
         game.get_next_state((0, 24, 23), 'PUT')
         #(('PUT', 'b', (3, 4)), ('REM', (4, 2)))
@@ -318,7 +618,7 @@ class TestZertzGame(unittest.TestCase):
         self.assertEqual(player_value, 1)
 
     def test_take_422(self):
-        game = ZertzGame(19)
+        game = self.ZertzGame(19)
         game.get_next_state((0, 11, 5), 'PUT')
         #print('')
         #print(np.sum(game.board.state[:2], axis=0))
@@ -330,18 +630,142 @@ class TestZertzGame(unittest.TestCase):
         #print(np.sum(game.board.state[:2], axis=0))
 
     def test_game_end(self):
-        game = ZertzGame(1)
+        game = self.ZertzGame(1)
         self.assertEqual(game.get_game_ended(), 0)
         game.get_next_state((2, 0, 1), 'PUT')
         self.assertEqual(game.get_game_ended(), 1)
-        game = ZertzGame(7)
+        game = self.ZertzGame(7)
         self.assertEqual(game.get_game_ended(), 0)
-        game.board.state[11] += 4
-        game.board.state[5] -= 4
+        state = game.board.state
+        state[11] += 4
+        state[5] -= 4
+        game.board.state = state
         self.assertEqual(game.get_game_ended(), -1)
 
+    def test_win_table(self):
+        # Custom win conditions are looked up from the captured marbles of either player
+        win_con = [{'w': 2}, {'g': 2}, {'b': 2}, {'w': 1, 'g': 1, 'b': 1}]
+        game = self.ZertzGame(19, win_con=win_con)
+        self.assertEqual(game._win_limits, [2, 2, 2])
+        for captured, ended in [([1, 1, 0], False), ([1, 1, 1], True), ([0, 0, 2], True),
+                                ([1, 0, 1], False), ([5, 0, 0], True)]:
+            for player in (0, 1):
+                state = self.ZertzGame(19).board.state
+                state[8 + 3 * player: 11 + 3 * player] = np.array(captured)[:, None, None]
+                game.board.state = state
+                self.assertEqual(game.get_game_ended() != 0, ended)
+                # Batches use the same compiled win conditions
+                batch = game.get_batch_board(1)
+                batch.states = state[None]
+                self.assertEqual(batch.get_game_ended()[0] != 0, ended)
+        # The open ring counter matches the board as a random game is played to the end
+        rng = np.random.RandomState(7)
+        game = self.ZertzGame(19, win_con=[])
+        def check_full():
+            state = game.board.state
+            self.assertEqual(game.board.is_full(), np.all(np.sum(state[0:4], axis=0) != 1))
+        check_full()
+        for _ in play_random_moves(game, rng):
+            check_full()
+        self.assertTrue(game.board.is_full())
+        # Without win conditions the batch games only end when the board is full
+        batch = game.get_batch_board(2)
+        self.assertTrue(np.all(batch.get_game_ended() == 0))
+
+    def test_state_functions(self):
+        # step, legal and terminal on state arrays match a game that takes the same actions
+        rng = np.random.RandomState(9)
+        game = self.ZertzGame(19, t=2)
+        functions = self.ZertzGame(19, t=2)
+        def check_functions(state):
+            action_type, actions = functions.legal(state)
+            self.assertEqual(action_type, game.get_legal_actions()[0])
+            self.assertTrue(np.all(actions == game.get_legal_actions()[1]))
+            self.assertEqual(functions.terminal(state), game.get_game_ended())
+        state, _ = game.get_current_state()
+        check_functions(state)
+        for action_type, action, (next_state, _) in play_random_moves(game, rng):
+            copied = np.copy(state)
+            stepped = functions.step(state, action, action_type)
+            # The given state is unchanged
+            self.assertTrue(np.all(state == copied))
+            self.assertTrue(np.all(stepped == next_state))
+            state = next_state
+            check_functions(state)
+        # The game board of the functions game was never used
+        self.assertTrue(np.all(functions.board.state == self.ZertzGame(19, t=2).board.state))
+
+    def test_evaluate(self):
+        # make_move_and_evaluate returns the same results as the separate calls
+        rng = np.random.RandomState(10)
+        game = self.ZertzGame(19)
+        def check_evaluate(state, value, legal, player_value):
+            self.assertEqual(value, game.get_game_ended())
+            if value != 0:
+                # The state is not built for a game that is over
+                self.assertEqual(state, None)
+                self.assertEqual(legal, None)
+                return
+            self.assertTrue(np.all(state == game.get_current_state()[0]))
+            self.assertEqual(player_value, game.get_cur_player_value())
+            action_type, actions = legal
+            self.assertEqual(action_type, game.get_legal_actions()[0])
+            self.assertTrue(np.all(actions == game.get_legal_actions()[1]))
+        check_evaluate(*game.evaluate())
+        for _, _, result in play_random_moves(game, rng, move=game.make_move_and_evaluate):
+            undo, state, value, legal, player_value = result
+            check_evaluate(state, value, legal, player_value)
+        self.assertNotEqual(value, 0)
+        game.unmake_move(undo)
+        self.assertEqual(game.get_game_ended(), 0)
+
+    def test_pack_state(self):
+        # Every state of a random game is rebuilt from the chain of packed states
+        rng = np.random.RandomState(8)
+        game = self.ZertzGame(37, t=3)
+        states = []
+        def check_packed(packed):
+            state, _ = game.get_current_state()
+            packed = game.pack_state(packed)
+            states.append((state, packed))
+            self.assertTrue(np.all(game.unpack_state(packed) == state))
+            self.assertTrue(len(packed.bits) + len(packed.counters) < 50)
+            return packed
+        packed = check_packed(None)
+        for _ in play_random_moves(game, rng):
+            packed = check_packed(packed)
+        out = np.zeros_like(states[0][0])
+        for state, packed in states:
+            self.assertTrue(np.all(game.unpack_state(packed, out) == state))
+            restored = pickle.loads(pickle.dumps(packed, 2))
+            self.assertTrue(np.all(game.unpack_state(restored) == state))
+
+    def test_symmetries(self):
+        game = self.ZertzGame(19)
+        game.get_next_state((0, 24, 23), 'PUT')
+        state, _ = game.get_current_state()
+        symmetries = game.get_symmetries(state)
+        self.assertEqual(len(symmetries), game.get_num_symmetries())
+        self.assertTrue(np.all(symmetries[0][1] == state))
+        for symmetry, symmetry_state in symmetries:
+            self.assertTrue(np.all(game.get_symmetry(symmetry) == symmetry_state))
+            # Values are for the player to move so they do not change when the players are swapped
+            self.assertEqual(game.translate_value_symmetry(symmetry, 1), 1)
+            if symmetry < 12:
+                self.assertEqual(symmetry_state[-1, 0, 0], 1)
+            else:
+                self.assertEqual(symmetry_state[-1, 0, 0], 0)
+
+    def test_hash(self):
+        game = self.ZertzGame(19)
+        start_hash = game.get_hash()
+        start_state, _ = game.get_current_state()
+        game.get_next_state((0, 24, 23), 'PUT')
+        self.assertNotEqual(game.get_hash(), start_hash)
+        self.assertEqual(game.get_hash(start_state), start_hash)
+
     def test_str_to_action(self):
-        game = ZertzGame(19)
+        game = self.ZertzGame(19)
         action_strs = ['PUT w A3 C5', 'PUT g A2 B4', 'PUT b A1 A3',
                    'PUT g C3', 'PUT g E1 D1']
         actions = [('PUT', (0, 0, 2)), ('PUT', (1, 5, 1)), ('PUT', (2, 10, 0)),
@@ -356,7 +780,7 @@ class TestZertzGame(unittest.TestCase):
             self.assertEqual(action, game.str_to_action(action_str))
 
     def test_str_to_action(self):
-        game = ZertzGame(19)
+        game = self.ZertzGame(19)
         action_strs = ['PUT w A3 C5', 'PUT g A2 B4', 'PUT b A1 A3',
                    'PUT g C3', 'PUT g E1 D1']
         actions = [('PUT', (0, 0, 2)), ('PUT', (1, 5, 1)), ('PUT', (2, 10, 0)),
@@ -374,6 +798,102 @@ class TestZertzGame(unittest.TestCase):
         for action, action_str in zip(actions, action_strs):
             self.assertEqual(action_str, game.action_to_str('CAP', action[1]))
 
-        
+
+class TestZertzBitBoard(TestZertzLogic):
+    Board = BitBoard
+
+    def test_region_tracking(self):
+        board = self.Board(19)
+        for action in [(2, 0, 16), (2, 2, 10), (2, 14, 11), (0, 22, 17), (2, 12, 24), (2, 8, 19)]:
+            board.take_action(action, 'PUT')
+        self.assertEqual(board._get_regions(), [board.bits[0]])
+        # Removing (3, 3) splits off the rings (4, 2) and (4, 3)
+        board.take_action((2, 1, 18), 'PUT')
+        split = (1 << (4 * 5 + 2)) | (1 << (4 * 5 + 3))
+        self.assertEqual(sorted(board._get_regions()), sorted([board.bits[0] & ~split, split]))
+        board.state = np.copy(board.state)
+        self.assertEqual(sorted(board._get_regions()), sorted([board.bits[0] & ~split, split]))
+
+    def test_region_labels_kept(self):
+        # The bitboard finds the regions from the ring mask so there are no labels to keep
+        pass
+
+    def test_matches_board(self):
+        # Play random games on both engines and check that every state and valid move matches.
+        # The actions are tuples of numpy integers and on 61 rings the locations go past 64 bits.
+        rng = np.random.RandomState(0)
+        for rings in [19] * 10 + [61] * 3:
+            board = Board(rings, t=2)
+            bitboard = BitBoard(rings, t=2)
+            while not board.is_full():
+                placement, capture = board.get_valid_moves()
+                bit_placement, bit_capture = bitboard.get_valid_moves()
+                self.assertTrue(np.all(placement == bit_placement))
+                self.assertTrue(np.all(capture == bit_capture))
+                self.assertTrue(np.all(board.state == bitboard.state))
+                self.assertEqual(board.get_hash(), bitboard.get_hash())
+                if np.any(capture):
+                    action_type, moves = 'CAP', np.argwhere(capture)
+                elif np.any(placement):
+                    action_type, moves = 'PUT', np.argwhere(placement)
+                else:
+                    break
+                action = tuple(moves[rng.randint(len(moves))])
+                board.take_action(action, action_type)
+                bitboard.take_action(action, action_type)
+
+class TestZertzBatchBoard(unittest.TestCase):
+    def test_matches_games(self):
+        # Play random games in lockstep and check that every state, valid move and result matches
+        # the same games played one at a time
+        rng = np.random.RandomState(5)
+        for rings, t in [(19, 1), (37, 3)]:
+            game = ZertzGame(rings, t=t)
+            num_games = 6
+            batch = game.get_batch_board(num_games)
+            games = [ZertzGame(rings, t=t) for _ in xrange(num_games)]
+            active = np.ones(num_games, dtype=bool)
+            while np.any(active):
+                placement, capture = batch.get_valid_moves()
+                ended = batch.get_game_ended()
+                states = batch.get_states()
+                actions = np.zeros(num_games, dtype=np.intp)
+                is_put = np.zeros(num_games, dtype=bool)
+                for i in np.flatnonzero(active):
+                    self.assertTrue(np.all(states[i] == games[i].board.state))
+                    valid_placement, valid_capture = games[i].get_valid_actions()
+                    self.assertTrue(np.all(placement[i] == valid_placement))
+                    self.assertTrue(np.all(capture[i] == valid_capture))
+                    self.assertEqual(ended[i], games[i].get_game_ended())
+                    if ended[i] != 0:
+                        active[i] = False
+                        continue
+                    chosen = random_action(games[i], rng)
+                    if chosen is None:
+                        active[i] = False
+                        continue
+                    action_type, action = chosen
+                    actions[i] = np.ravel_multi_index(action, action_shape(game, action_type))
+                    is_put[i] = action_type == 'PUT'
+                    games[i].get_next_state(action, action_type)
+                batch.take_actions(actions, is_put, active)
+
+    def test_load_states(self):
+        game = ZertzGame(19, t=2)
+        game.get_next_state((0, 24, 23), 'PUT')
+        state, _ = game.get_current_state()
+        batch = game.get_batch_board(3)
+        batch.states = np.stack([state] * 3)
+        self.assertTrue(np.all(batch.get_states() == state))
+        out = np.zeros((3,) + state.shape, dtype=np.uint8)
+        batch.get_states(out)
+        self.assertTrue(np.all(out == state))
+        batch.reset([1])
+        self.assertTrue(np.all(batch.states[1] == ZertzGame(19, t=2).board.state))
+        self.assertTrue(np.all(batch.states[2] == state))
+
+class TestZertzGameBitBoard(TestZertzGame):
+    engine = 'bitboard'
+
 if __name__ == '__main__':
     unittest.main()
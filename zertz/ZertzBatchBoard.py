@@ -0,0 +1,282 @@
+import numpy as np
+
+from .ZertzLogic import Board
+
+
+class BatchBoard(object):
+    # A batch of N independent zertz games that are stepped together.
+    #
+    # The games follow the same rules as Board but every operation is done for all of the games at
+    # once with numpy so there are no Python loops over games. Locations are flat indices
+    # (y * width + x) and use the neighbor and jump tables of Board (see Board._get_tables):
+    #   - pieces = (N x 4 x w^2 + 1) ring, white, gray and black layers of each game. The last
+    #     location is always 0 so that lookups of neighbors off the board find nothing.
+    #   - history = (N x t - 1 x 4 x w^2) ring buffer of the previous t - 1 ring and marble layers,
+    #     with the most recent previous step of game i at history[i, heads[i]]
+    #   - capture = (N x w^2 + 1) True at the marble that must be used for a chain capture
+    #   - supply = (N x 9) supply and captured marbles in the same order as Board.supply
+    #   - player = (N) current player (0 or 1)
+    #
+    # Actions are flat indices into the placement matrix (3 x w^2 x w^2 + 1) or the capture matrix
+    # (6 x w x w) of each game (see ZertzGame.get_legal_actions).
+
+    def __init__(self, num_games, win_table, rings=37, marbles=None, t=1):
+        # win_table = the (limits, table) win conditions compiled by ZertzGame._build_win_table so
+        # both engines use the same rules. Batches are created with ZertzGame.get_batch_board.
+        self.num_games = num_games
+        self.rings = rings
+        self.width = 0
+        for total, width in Board._HEX_NUMBERS:
+            if total == self.rings:
+                self.width = width
+        assert self.width != 0
+        self.t = t
+        if marbles is None:
+            marbles = {'w': 6, 'g': 8, 'b': 10}
+        self.marbles = marbles
+        self._win_limits = np.array(win_table[0], dtype=np.int32)
+        self._win_table = np.array(win_table[1], dtype=bool)
+        self._neighbors, self._jumps = Board._get_tables(self.width)[:2]
+
+        size = self.width**2
+        self.pieces = np.zeros((num_games, 4, size + 1), dtype=np.uint8)
+        self.history = np.zeros((num_games, max(t - 1, 1), 4, size), dtype=np.uint8)
+        self.heads = np.zeros(num_games, dtype=np.intp)
+        self.capture = np.zeros((num_games, size + 1), dtype=bool)
+        self.supply = np.zeros((num_games, 9), dtype=np.int32)
+        self.player = np.zeros(num_games, dtype=np.int32)
+        self.reset()
+
+    def reset(self, games=None):
+        # Return the games (default: all games) to the start of a new game
+        if games is None:
+            games = np.arange(self.num_games)
+        size = self.width**2
+        ys, xs = np.divmod(np.arange(size), self.width)
+        self.pieces[games] = 0
+        self.pieces[games, 0, :size] = np.abs(ys - xs) <= self.width // 2
+        self.history[games] = 0
+        self.heads[games] = 0
+        self.capture[games] = False
+        self.supply[games] = [self.marbles['w'], self.marbles['g'], self.marbles['b'],
+                              0, 0, 0, 0, 0, 0]
+        self.player[games] = 0
+
+    @property
+    def states(self):
+        return self.get_states()
+
+    @states.setter
+    def states(self, states):
+        # Load every game from an (N x L x H x W) batch of states (see Board.__init__)
+        size = self.width**2
+        history = 4 * self.t
+        flat = states.reshape(self.num_games, history + 11, size)
+        self.pieces[:, :, :size] = flat[:, 0:4]
+        self.pieces[:, :, size] = 0
+        for step in range(1, self.t):
+            self.history[:, step - 1] = flat[:, 4 * step: 4 * step + 4]
+        self.heads[:] = 0
+        self.capture[:, :size] = flat[:, history] != 0
+        self.capture[:, size] = False
+        self.supply[:] = flat[:, history + 1: history + 10, 0]
+        self.player[:] = flat[:, history + 10, 0]
+
+    def get_states(self, out=None):
+        # Return the (N x L x H x W) batch of states, the same as Board.get_state for each game.
+        # This is the input batch for the network. If out is given the states are written into it.
+        size = self.width**2
+        history = 4 * self.t
+        if out is None:
+            out = np.empty((self.num_games, history + 11, self.width, self.width), dtype=np.uint8)
+        flat = out.reshape(self.num_games, history + 11, size)
+        games = np.arange(self.num_games)
+        flat[:, 0:4] = self.pieces[:, :, :size]
+        for step in range(1, self.t):
+            slots = (self.heads + step - 1) % (self.t - 1)
+            flat[:, 4 * step: 4 * step + 4] = self.history[games, slots]
+        flat[:, history] = self.capture[:, :size]
+        flat[:, history + 1: history + 10] = self.supply[:, :, None]
+        flat[:, history + 10] = self.player[:, None]
+        return out
+
+    def get_cur_player_values(self):
+        # Return 1 for games where the first player is next and -1 for the second player
+        return 1 - 2 * self.player
+
+    def _get_masks(self):
+        # Return (N x w^2 + 1) boolean masks of the rings and the occupied rings
+        rings = self.pieces[:, 0] == 1
+        occupied = np.any(self.pieces[:, 1:4], axis=1)
+        return rings, occupied
+
+    def get_capture_moves(self):
+        # Return an (N x 6 x w x w) boolean matrix of the valid capture actions of each game
+        size = self.width**2
+        rings, occupied = self._get_masks()
+        empty = rings & ~occupied
+        # Only the marble at the capture layer can be used during a chain capture
+        in_chain = np.any(self.capture, axis=1)
+        sources = np.where(in_chain[:, None], self.capture, occupied)[:, :size]
+        moves = (sources[:, :, None] & occupied[:, self._neighbors]
+                 & empty[:, self._jumps])
+        return moves.transpose(0, 2, 1).reshape(self.num_games, 6, self.width, self.width)
+
+    def _get_removable_mask(self, rings, occupied):
+        # Return an (N x w^2) boolean mask of the rings that can be removed. A ring is removable if
+        # it is empty and two of its neighbors in a row are missing.
+        size = self.width**2
+        missing = ~rings[:, self._neighbors]
+        in_a_row = np.any(missing & np.roll(missing, -1, axis=2), axis=2)
+        return (rings & ~occupied)[:, :size] & in_a_row
+
+    def get_placement_moves(self):
+        # Return an (N x 3 x w^2 x w^2 + 1) boolean matrix of the valid placement actions of each
+        # game, following Board._build_placement_moves
+        size = self.width**2
+        rings, occupied = self._get_masks()
+        open_mask = (rings & ~occupied)[:, :size]
+        removable = self._get_removable_mask(rings, occupied)
+
+        moves = np.zeros((self.num_games, size, size + 1), dtype=bool)
+        np.logical_and(open_mask[:, :, None], removable[:, None, :], out=moves[:, :, :size])
+        moves[:, np.arange(size), np.arange(size)] = False
+        num_removable = np.count_nonzero(removable, axis=1)[:, None]
+        moves[:, :, size] = np.where(num_removable == 0, open_mask,
+                                     (num_removable == 1) & open_mask & removable)
+
+        # If the supply is empty the player must use the marbles they captured
+        counts = self.supply[:, 0:3]
+        captured = self.supply[np.arange(self.num_games)[:, None],
+                               3 + 3 * self.player[:, None] + np.arange(3)]
+        counts = np.where(np.any(counts > 0, axis=1)[:, None], counts, captured)
+        return moves[:, None] & (counts > 0)[:, :, None, None]
+
+    def get_valid_moves(self):
+        # Return the placement and capture matrices of every game. Capturing is compulsory so the
+        # placement actions are all False in games that have a valid capture.
+        capture = self.get_capture_moves()
+        placement = self.get_placement_moves()
+        placement &= ~np.any(capture.reshape(self.num_games, -1), axis=1)[:, None, None, None]
+        return placement, capture
+
+    def is_full(self):
+        # Return an (N) boolean array that is True for games where every ring has a marble
+        rings, occupied = self._get_masks()
+        return ~np.any(rings & ~occupied, axis=1)
+
+    def get_game_ended(self):
+        # Return an (N) array with the result of each game using the rules of
+        # ZertzGame.get_game_ended: 1 if the first player won, -1 if the second player won and 0
+        # if the game has not ended
+        # Look up the captured marbles of both players in the win table after clipping them to
+        # the limits (see ZertzGame._is_game_over)
+        captured = np.minimum(self.supply[:, 3:9].reshape(self.num_games, 2, 3), self._win_limits)
+        won = self._win_table[captured[:, :, 0], captured[:, :, 1], captured[:, :, 2]]
+        over = np.any(won, axis=1) | self.is_full()
+        # The winner is the player who made the previous action unless they are in a chain capture
+        values = self.get_cur_player_values()
+        values = np.where(np.any(self.capture, axis=1), values, -values)
+        return np.where(over, values, 0)
+
+    def take_actions(self, actions, is_put, active=None):
+        # Take one action in each game. actions is an (N) array of flat action indices and is_put
+        # is an (N) boolean array which is True for placement actions and False for captures.
+        # Optional: active = (N) boolean array, games where it is False are left unchanged
+        actions = np.asarray(actions)
+        is_put = np.asarray(is_put, dtype=bool)
+        if active is None:
+            games = np.arange(self.num_games)
+        else:
+            games = np.flatnonzero(active)
+
+        # Save the ring and marble layers to the history
+        if self.t > 1:
+            self.heads[games] = (self.heads[games] - 1) % (self.t - 1)
+            self.history[games, self.heads[games]] = self.pieces[games, :, :self.width**2]
+
+        put_games = games[is_put[games]]
+        cap_games = games[~is_put[games]]
+        if len(put_games):
+            self._take_placement_actions(put_games, actions[put_games])
+        if len(cap_games):
+            self._take_capture_actions(cap_games, actions[cap_games])
+
+    def _take_placement_actions(self, games, actions):
+        size = self.width**2
+        marble_index, rest = np.divmod(actions, size * (size + 1))
+        put_loc, rem_loc = np.divmod(rest, size + 1)
+
+        # Place the marble, taking it from the captured marbles if the supply is empty
+        self.pieces[games, marble_index + 1, put_loc] = 1
+        in_supply = self.supply[games, marble_index] >= 1
+        supply_index = np.where(in_supply, marble_index, 3 + 3 * self.player[games] + marble_index)
+        self.supply[games, supply_index] -= 1
+
+        # Remove the rings
+        removed = rem_loc != size
+        self.pieces[games[removed], 0, rem_loc[removed]] = 0
+
+        self._capture_isolated(games)
+        self.player[games] = 1 - self.player[games]
+
+    def _capture_isolated(self, games):
+        # Capture every region without an empty ring in the games where the board is separated
+        # into more than one region (the same rule as Board.take_placement_action)
+        size = self.width**2
+        pieces = self.pieces[games]
+        rings = pieces[:, 0, :size] == 1
+        occupied = np.any(pieces[:, 1:4, :size], axis=1)
+
+        # Label each ring with the smallest location in its region by repeatedly taking the
+        # smallest label of the neighboring rings. Locations without a ring have the label w^2.
+        labels = np.where(rings, np.arange(size), size)
+        padded = np.full((len(games), size + 1), size, dtype=labels.dtype)
+        while True:
+            padded[:, :size] = labels
+            smallest = np.minimum(labels, np.min(padded[:, self._neighbors], axis=2))
+            smallest[~rings] = size
+            if np.array_equal(smallest, labels):
+                break
+            labels = smallest
+
+        rows, locs = np.nonzero(rings & ~occupied)
+        has_empty = np.zeros((len(games), size + 1), dtype=bool)
+        has_empty[rows, labels[rows, locs]] = True
+        num_regions = np.count_nonzero(rings & (labels == np.arange(size)), axis=1)
+        captured = (rings & ~has_empty[np.arange(len(games))[:, None], labels]
+                    & (num_regions > 1)[:, None])
+        if not np.any(captured):
+            return
+
+        # Give the marbles to the current player and remove the regions
+        counts = np.count_nonzero(pieces[:, 1:4, :size] & captured[:, None], axis=2)
+        supply_index = 3 + 3 * self.player[games][:, None] + np.arange(3)
+        self.supply[games[:, None], supply_index] += counts
+        pieces[:, :, :size] *= ~captured[:, None]
+        self.pieces[games] = pieces
+
+    def _take_capture_actions(self, games, actions):
+        direction, src_loc = np.divmod(actions, self.width**2)
+        cap_loc = self._neighbors[src_loc, direction]
+        dst_loc = self._jumps[src_loc, direction]
+
+        # Move the capturing marble and give the captured marble to the current player
+        marble_layer = np.argmax(self.pieces[games, 1:4, src_loc], axis=1) + 1
+        self.pieces[games, marble_layer, src_loc] = 0
+        self.pieces[games, marble_layer, dst_loc] = 1
+        captured_index = np.argmax(self.pieces[games, 1:4, cap_loc], axis=1)
+        self.supply[games, 3 + 3 * self.player[games] + captured_index] += 1
+        self.pieces[games, 1:4, cap_loc] = 0
+
+        # Mark the marble for a chain capture if it can capture again, otherwise the turn is over
+        rings = self.pieces[games, 0] == 1
+        occupied = np.any(self.pieces[games, 1:4], axis=1)
+        rows = np.arange(len(games))[:, None]
+        neighbors = self._neighbors[dst_loc]
+        jumps = self._jumps[dst_loc]
+        chain = np.any(occupied[rows, neighbors] & rings[rows, jumps] & ~occupied[rows, jumps],
+                       axis=1)
+        self.capture[games] = False
+        self.capture[games[chain], dst_loc[chain]] = True
+        self.player[games[~chain]] = 1 - self.player[games[~chain]]
@@ -0,0 +1,458 @@
+import binascii
+import numpy as np
+
+from .ZertzLogic import Board
+
+
+class BitBoard(Board):
+    # Alternative board core with the same interface as Board.
+    #
+    # Instead of a layered numpy array the board is stored as Python integers used as bitmasks:
+    #   - bits[0] = rings
+    #   - bits[1] = white marbles
+    #   - bits[2] = gray marbles
+    #   - bits[3] = black marbles
+    #   - capture = location of the marble that must be used for a chain capture (0 if none)
+    #   - regions = list with a mask for each continuous region of rings (None until needed)
+    # Bit (y * width + x) of a mask is set when location (y, x) of the matching layer in Board.state
+    # would be 1. Neighbors and jump destinations are found by shifting whole masks so that no
+    # scalar numpy indexing is needed during play. Supply and captured marble counts are kept in a
+    # list of 9 integers using the same order as the supply layers of Board.state.
+    #
+    # The state tensor that is used as input for the network is only built when the state property
+    # is read and assigning to the state property loads the board from a state tensor.
+
+    # Shift tables built once for each board width (see _get_shift_tables)
+    _SHIFT_TABLES = {}
+
+    def __init__(self, rings=37, marbles=None, t=1, clone=None):
+        if clone is not None:
+            self.rings = clone.rings
+            self.width = clone.width
+            self.t = clone.t
+            self._CAPTURE_LAYER = clone._CAPTURE_LAYER
+            self._MARBLE_TO_SUPPLY = clone._MARBLE_TO_SUPPLY
+            self._init_tables()
+            self._init_shift_tables()
+            self.bits = list(clone.bits)
+            self.capture = clone.capture
+            self.regions = None if clone.regions is None else list(clone.regions)
+            self.history = list(clone.history)
+            self.supply = list(clone.supply)
+            self.player = clone.player
+        else:
+            self.rings = rings
+            self.width = 0
+            for total, width in self._HEX_NUMBERS:
+                if total == self.rings:
+                    self.width = width
+            assert self.width != 0
+
+            self.t = t
+            self._CAPTURE_LAYER = self.t * 4
+            self._MARBLE_TO_SUPPLY = {'w': self.t * 4 + 1,
+                                      'g': self.t * 4 + 2,
+                                      'b': self.t * 4 + 3}
+            self._init_tables()
+            self._init_shift_tables()
+
+            # Place rings and start with an empty board history
+            self.bits = [self._hex_mask, 0, 0, 0]
+            self.capture = 0
+            self.regions = [self._hex_mask]
+            self.history = [(0, 0, 0, 0)] * (self.t - 1)
+
+            # Supply followed by the captured marbles for player 1 and player 2
+            if marbles is None:
+                self.supply = [6, 8, 10, 0, 0, 0, 0, 0, 0]
+            else:
+                self.supply = [marbles['w'], marbles['g'], marbles['b'], 0, 0, 0, 0, 0, 0]
+            self.player = 0
+
+    def _init_shift_tables(self):
+        tables = self._get_shift_tables(self.width)
+        self._full_mask, self._hex_mask, self._shifts, self._src_masks, self._nbytes = tables
+
+    @classmethod
+    def _get_shift_tables(cls, width):
+        # Return the masks and shift amounts for a board width. These are shared by every BitBoard
+        # of the same width.
+        if width not in cls._SHIFT_TABLES:
+            size = width * width
+            full_mask = (1 << size) - 1
+            # Board locations, the same rings that Board places in its initial state
+            middle = width // 2
+            hex_mask = 0
+            for y in range(width):
+                for x in range(width):
+                    if abs(y - x) <= middle:
+                        hex_mask |= 1 << (y * width + x)
+            # Only locations that do not wrap around to another row can be shifted left or right
+            not_first_col = 0
+            not_last_col = 0
+            for y in range(width):
+                for x in range(width):
+                    if x > 0:
+                        not_first_col |= 1 << (y * width + x)
+                    if x < width - 1:
+                        not_last_col |= 1 << (y * width + x)
+            shifts = []
+            src_masks = []
+            for dy, dx in cls._DIRECTIONS:
+                shifts.append(dy * width + dx)
+                if dx == 1:
+                    src_masks.append(not_last_col)
+                elif dx == -1:
+                    src_masks.append(not_first_col)
+                else:
+                    src_masks.append(full_mask)
+            nbytes = (size + 7) // 8
+            cls._SHIFT_TABLES[width] = (full_mask, hex_mask, shifts, src_masks, nbytes)
+        return cls._SHIFT_TABLES[width]
+
+    def _shift(self, bits, direction):
+        # Return the mask of locations reached by moving every location in bits one step in direction
+        bits &= self._src_masks[direction]
+        shift = self._shifts[direction]
+        if shift > 0:
+            return (bits << shift) & self._full_mask
+        return bits >> -shift
+
+    def _shift_back(self, bits, direction):
+        # Return the mask of locations whose neighbor in direction is in bits
+        return self._shift(bits, (direction + 3) % 6)
+
+    def _bits_to_plane(self, bits, plane):
+        # Write a bitmask into a flattened (w^2) plane
+        hex_str = '%0*x' % (2 * self._nbytes, bits)
+        raw = np.frombuffer(binascii.unhexlify(hex_str), dtype=np.uint8)
+        plane[:] = np.unpackbits(raw)[::-1][:self.width**2]
+
+    def _plane_to_bits(self, plane):
+        # Return the bitmask of the nonzero locations of a (w x w) plane
+        padded = np.zeros(8 * self._nbytes, dtype=np.uint8)
+        padded[:self.width**2] = plane.ravel() != 0
+        return int(binascii.hexlify(np.packbits(padded[::-1]).tobytes()), 16)
+
+    def _bits_to_indices(self, bits):
+        # Return a list of (y, x) indices for every location in bits
+        indices = []
+        while bits:
+            low = bits & -bits
+            loc = low.bit_length() - 1
+            indices.append((loc // self.width, loc % self.width))
+            bits ^= low
+        return indices
+
+    def _index_to_bit(self, index):
+        # Indices are often numpy integers (i.e. from np.argwhere) which wrap around when shifted
+        # past 64 bits, so the location is converted to a Python int first
+        y, x = index
+        return 1 << int(y * self.width + x)
+
+    @property
+    def state(self):
+        return self.get_state()
+
+    def get_state(self, out=None):
+        # Build the L x H x W state tensor described in Board.__init__, writing it into out if given
+        t = self.t
+        if out is None:
+            state = np.zeros((4 * t + 11, self.width, self.width), dtype=np.uint8)
+        else:
+            state = out
+            state[...] = 0
+        flat = state.reshape(4 * t + 11, self.width**2)
+        for layer, bits in enumerate(self.bits):
+            self._bits_to_plane(bits, flat[layer])
+        for step, past in enumerate(self.history):
+            for layer, bits in enumerate(past):
+                if bits:
+                    self._bits_to_plane(bits, flat[4 * (step + 1) + layer])
+        if self.capture:
+            self._bits_to_plane(self.capture, flat[self._CAPTURE_LAYER])
+        state[t * 4 + 1: t * 4 + 10] = np.array(self.supply, dtype=np.uint8)[:, None, None]
+        state[t * 4 + 10] = self.player
+        return state
+
+    @state.setter
+    def state(self, state):
+        # Load the board from an L x H x W state tensor
+        t = self.t
+        assert state.shape[0] == 4 * t + 11
+        self.bits = [self._plane_to_bits(state[layer]) for layer in range(4)]
+        self.history = [tuple(self._plane_to_bits(state[4 * step + layer]) for layer in range(4))
+                        for step in range(1, t)]
+        self.capture = self._plane_to_bits(state[self._CAPTURE_LAYER])
+        self.regions = None
+        self.supply = [int(count) for count in state[t * 4 + 1: t * 4 + 10, 0, 0]]
+        self.player = int(state[t * 4 + 10, 0, 0])
+
+    def _get_occupied(self):
+        return self.bits[1] | self.bits[2] | self.bits[3]
+
+    def _get_open(self):
+        return self.bits[0] & ~self._get_occupied()
+
+    def _get_regions(self):
+        # Return the list of continuous regions on the board as bitmasks
+        if self.regions is None:
+            self.regions = self._split_regions(self.bits[0])
+        return self.regions
+
+    def _split_regions(self, remaining):
+        # Return a list of the continuous regions of rings in the mask remaining
+        regions = []
+        while remaining:
+            # Grow a region from the lowest remaining ring until it stops changing
+            region = remaining & -remaining
+            while True:
+                grown = region
+                for direction in range(6):
+                    grown |= self._shift(region, direction)
+                grown &= remaining
+                if grown == region:
+                    break
+                region = grown
+            regions.append(region)
+            remaining &= ~region
+        return regions
+
+    def _remove_region_ring(self, rem_bit):
+        # Update the regions after the ring at rem_bit has been removed from the board and return
+        # a list of any regions that were split off by the removal
+        regions = self._get_regions()
+        for i, region in enumerate(regions):
+            if region & rem_bit:
+                break
+        region &= ~rem_bit
+        if not region:
+            del regions[i]
+            return []
+        regions[i] = region
+
+        # The region can only be split if the remaining neighbors of the removed ring form more
+        # than one run of consecutive directions
+        present = [bool(self._shift(rem_bit, direction) & region) for direction in range(6)]
+        runs = sum(1 for d in range(6) if present[d] and not present[d - 1])
+        if runs < 2:
+            return []
+        split = self._split_regions(region)
+        regions[i:i + 1] = split
+        return split[1:]
+
+    def get_cur_player(self):
+        return self.player
+
+    def _next_player(self):
+        self.player = (self.player + 1) % 2
+
+    def get_captured(self, player):
+        start = 3 + 3 * player
+        return self.supply[start: start + 3]
+
+    def in_chain_capture(self):
+        return self.capture != 0
+
+    def is_full(self):
+        return self._get_open() == 0
+
+    def get_num_rings(self):
+        return bin(self.bits[0]).count('1')
+
+    def _compute_hash(self):
+        # Same Zobrist hash as Board._compute_hash using the masks
+        piece_keys, capture_keys, supply_keys, player_key = self._zobrist_keys
+        value = 0
+        for layer, bits in enumerate(self.bits + [self.capture]):
+            keys = piece_keys[layer] if layer < 4 else capture_keys
+            while bits:
+                low = bits & -bits
+                value ^= keys[low.bit_length() - 1]
+                bits ^= low
+        for index, count in enumerate(self.supply):
+            value ^= supply_keys[index][count]
+        if self.player == 1:
+            value ^= player_key
+        return value
+
+    def get_hash(self):
+        # The hash is computed from the masks when requested instead of being updated by actions
+        return self._compute_hash()
+
+    def _get_marble_type_at(self, index):
+        bit = self._index_to_bit(index)
+        for layer in (1, 2, 3):
+            if self.bits[layer] & bit:
+                return self._LAYER_TO_MARBLE[layer]
+        # Matches Board which reports an empty ring as white
+        return 'w'
+
+    def take_action(self, action, action_type):
+        # Push back the previous t states
+        if self.t > 1:
+            self.history.insert(0, tuple(self.bits))
+            self.history.pop()
+
+        if action_type == 'PUT':
+            self.take_placement_action(action)
+        elif action_type == 'CAP':
+            self.take_capture_action(action)
+
+    def make_move(self, action, action_type):
+        # Same as Board.make_move. The masks are integers so the undo record is a copy of the lists
+        # that take_action modifies along with the other attributes.
+        regions = None if self.regions is None else list(self.regions)
+        undo = (list(self.bits), self.capture, regions, list(self.history), list(self.supply),
+                self.player)
+        self.take_action(action, action_type)
+        return undo
+
+    def unmake_move(self, undo):
+        self.bits, self.capture, self.regions, self.history, self.supply, self.player = undo
+
+    def _take_marble(self, marble_index):
+        # Remove a marble of the given type index (0, 1 or 2) from the supply or, if the supply is
+        # empty, from the marbles the current player has captured
+        if self.supply[marble_index] >= 1:
+            self.supply[marble_index] -= 1
+        else:
+            captured_index = 3 + 3 * self.player + marble_index
+            assert self.supply[captured_index] >= 1
+            self.supply[captured_index] -= 1
+
+    def take_placement_action(self, action):
+        type_index, put_loc, rem_loc = action
+
+        # Place the marble on the board
+        put_bit = 1 << int(put_loc)
+        assert self._get_open() & put_bit
+        self.bits[type_index + 1] |= put_bit
+        self._take_marble(type_index)
+
+        # Remove the ring from the board
+        if rem_loc != self.width**2:
+            rem_bit = 1 << int(rem_loc)
+            self.bits[0] &= ~rem_bit
+            self._remove_region_ring(rem_bit)
+
+        # If the board has been separated then every region without an empty ring is captured
+        regions = self._get_regions()
+        if len(regions) > 1:
+            open_rings = self._get_open()
+            captured_start = 3 + 3 * self.player
+            for region in [region for region in regions if not region & open_rings]:
+                for layer in (1, 2, 3):
+                    count = bin(self.bits[layer] & region).count('1')
+                    self.supply[captured_start + layer - 1] += count
+                    self.bits[layer] &= ~region
+                self.bits[0] &= ~region
+                regions.remove(region)
+
+        self._next_player()
+
+    def take_capture_action(self, action):
+        direction, y, x = action
+        dy, dx = self._DIRECTIONS[direction]
+        y, x = int(y), int(x)
+        src_bit = 1 << (y * self.width + x)
+        cap_bit = 1 << ((y + dy) * self.width + x + dx)
+        dst_bit = 1 << ((y + 2 * dy) * self.width + x + 2 * dx)
+
+        # Move the capturing marble from src to dst
+        for layer in (1, 2, 3):
+            if self.bits[layer] & src_bit:
+                self.bits[layer] ^= src_bit | dst_bit
+                break
+
+        # Give the captured marble to the current player and remove it from the board
+        captured_layer = 0
+        for layer in (1, 2, 3):
+            if self.bits[layer] & cap_bit:
+                captured_layer = layer
+                break
+        assert captured_layer != 0
+        self.bits[captured_layer] &= ~cap_bit
+        self.supply[3 + 3 * self.player + captured_layer - 1] += 1
+
+        # Update the capture marker if there is a forced chain capture
+        self.capture = 0
+        occupied = self._get_occupied()
+        empty = self.bits[0] & ~occupied
+        for direction in range(6):
+            neighbor = self._shift(dst_bit, direction)
+            if neighbor & occupied and self._shift(neighbor, direction) & empty:
+                self.capture = dst_bit
+                break
+
+        if not self.capture:
+            self._next_player()
+
+    def _get_capture_sources(self):
+        # Return a list with a mask for each direction of the marbles that can capture in that direction
+        occupied = self._get_occupied()
+        empty = self.bits[0] & ~occupied
+        sources = occupied if not self.capture else self.capture
+        capture_sources = []
+        for direction in range(6):
+            jumpable = self._shift_back(occupied, direction)
+            landing = self._shift_back(self._shift_back(empty, direction), direction)
+            capture_sources.append(sources & jumpable & landing)
+        return capture_sources
+
+    def get_valid_moves(self):
+        capture_sources = self._get_capture_sources()
+        if any(capture_sources):
+            capture = np.zeros((6, self.width**2), dtype=bool)
+            for direction, bits in enumerate(capture_sources):
+                self._bits_to_plane(bits, capture[direction])
+            placement = np.zeros((3, self.width**2, self.width**2 + 1), dtype=bool)
+            return (placement, capture.reshape(6, self.width, self.width))
+        return (self.get_placement_moves(), np.zeros((6, self.width, self.width), dtype=bool))
+
+    def get_legal_actions(self):
+        capture_sources = self._get_capture_sources()
+        if any(capture_sources):
+            actions = []
+            for direction, bits in enumerate(capture_sources):
+                actions.extend(direction * self.width**2 + y * self.width + x
+                               for y, x in self._bits_to_indices(bits))
+            return ('CAP', np.array(actions, dtype=np.intp))
+        return ('PUT', self._build_placement_actions(*self._get_placement_masks()))
+
+    def get_capture_moves(self):
+        capture = np.zeros((6, self.width**2), dtype=bool)
+        for direction, bits in enumerate(self._get_capture_sources()):
+            self._bits_to_plane(bits, capture[direction])
+        return capture.reshape(6, self.width, self.width)
+
+    def _get_placement_masks(self):
+        size = self.width**2
+        open_mask = np.zeros(size, dtype=bool)
+        removable_mask = np.zeros(size, dtype=bool)
+        self._bits_to_plane(self._get_open(), open_mask)
+        self._bits_to_plane(self._get_removable_mask(), removable_mask)
+
+        # If the supply is empty then the player must use a captured marble
+        marble_counts = self.supply[0:3]
+        if not any(marble_counts):
+            marble_counts = self.get_captured(self.player)
+        return marble_counts, open_mask, removable_mask
+
+    def _get_open_rings(self):
+        return self._bits_to_indices(self._get_open())
+
+    def _get_removable_mask(self):
+        # Return the mask of open rings that have two consecutive missing neighbors
+        rings = self.bits[0]
+        missing = [~self._shift_back(rings, direction) for direction in range(6)]
+        removable = 0
+        for direction in range(6):
+            removable |= missing[direction] & missing[(direction + 1) % 6]
+        return removable & self._get_open()
+
+    def _is_removable(self, index):
+        return bool(self._get_removable_mask() & self._index_to_bit(index))
+
+    def _get_removable_rings(self):
+        return self._bits_to_indices(self._get_removable_mask())
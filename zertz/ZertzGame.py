@@ -2,13 +2,22 @@ import numpy as np
 import copy
 
 from .ZertzLogic import Board
+from .ZertzBitBoard import BitBoard
+from .ZertzBatchBoard import BatchBoard
+from .ZertzPackedState import PackedState
 
 
 # For full rules: http://www.gipf.com/zertz/rules/rules.html
 # Class interface inspired by https://github.com/suragnair/alpha-zero-general
 
 class ZertzGame():
-    def __init__(self, rings=37, marbles=None, win_con=None, t=1, clone=None, clone_state=None):
+    # Board implementations that can be selected with the engine argument
+    #   - 'numpy' stores the board as a layered numpy array (see ZertzLogic.Board)
+    #   - 'bitboard' stores the board as integer bitmasks (see ZertzBitBoard.BitBoard)
+    _ENGINES = {'numpy': Board, 'bitboard': BitBoard}
+
+    def __init__(self, rings=37, marbles=None, win_con=None, t=1, clone=None, clone_state=None,
+                 engine='numpy'):
         if clone is not None:
             # Creates an instance of ZertzGame with settings copied from clone and updated to 
             # have the same board state as clone_state
@@ -16,16 +25,22 @@ class ZertzGame():
             self.t = clone.t
             self.marbles = copy.copy(clone.marbles)
             self.win_con = copy.copy(clone.win_con)
-            self.board = Board(clone=clone.board)
+            self._win_limits, self._win_table = clone._win_limits, clone._win_table
+            self.engine = clone.engine
+            self.board = self._ENGINES[self.engine](clone=clone.board)
+            self._scratch_board = None
+            assert 4 * self.t + 11 == clone_state.shape[0]
             self.board.state = np.copy(clone_state)
-            assert clone.board.state.shape[0] == clone_state.shape[0]
         else:
             # The size of the game board
             #   default: 37 rings (approximately 7x7 hex)
             self.initial_rings = rings
             self.t = t
             self.marbles = marbles
-            self.board = Board(self.initial_rings, self.marbles, self.t)
+            self.engine = engine
+            self.board = self._ENGINES[self.engine](self.initial_rings, self.marbles, self.t)
+            # Board reused by the functions on state arrays (see _load_scratch_board)
+            self._scratch_board = None
 
             # The win conditions (amount of each marble needed)
             #   default:
@@ -39,26 +54,67 @@ class ZertzGame():
                                 {'w': 4}, {'g': 5}, {'b': 6}]
             else:
                 self.win_con = win_con
+            self._win_limits, self._win_table = self._build_win_table()
 
     def __deepcopy__(self, memo):
         return ZertzGame(clone=self, clone_state=self.board.state)
 
     def reset_board(self):
-        self.board = Board(self.initial_rings, self.marbles, self.t)
+        self.board = self._ENGINES[self.engine](self.initial_rings, self.marbles, self.t)
+
+    def get_batch_board(self, num_games):
+        # Returns a BatchBoard of num_games new games with the same settings as this game. The
+        # games can be stepped together and give a batch of states for the network.
+        return BatchBoard(num_games, (self._win_limits, self._win_table), self.initial_rings,
+                          self.marbles, self.t)
 
-    def get_cur_player_value(self):
+    def get_cur_player_value(self, board=None):
         # Returns 1 if current player is player 0 and -1 if current player is player 1
-        if self.board.state[-1, 0, 0] == 0:
+        #   - Optional: board = a board to use instead of the game board
+        if board is None:
+            board = self.board
+        if board.get_cur_player() == 0:
             player_value = 1
-        elif self.board.state[-1, 0, 0] == 1:
+        elif board.get_cur_player() == 1:
             player_value = -1
         return player_value
 
-    def get_current_state(self):
+    def _load_scratch_board(self, state, copy_state=False):
+        # Returns the scratch board loaded with an arbitrary board state. The scratch board is
+        # created once and then reused by every function that takes a state array, so no game or
+        # board objects are built for each call. Loading a state only reads it unless the board
+        # takes an action, in which case copy_state must be True to leave the state unchanged.
+        if self._scratch_board is None:
+            self._scratch_board = self._ENGINES[self.engine](clone=self.board)
+        if copy_state:
+            state = np.copy(state)
+        self._scratch_board.state = state
+        return self._scratch_board
+
+    def step(self, state, action, action_type, out=None):
+        # Returns the board state after taking the action from an arbitrary board state. Neither
+        # the given state nor the game board are changed. If out is given then the next state is
+        # written into it instead of a new array.
+        board = self._load_scratch_board(state, copy_state=True)
+        board.take_action(action, action_type)
+        return board.get_state(out)
+
+    def legal(self, state):
+        # Returns the legal actions of an arbitrary board state as a tuple of the action type and
+        # the flat indices of the valid actions (see get_legal_actions)
+        return self._load_scratch_board(state).get_legal_actions()
+
+    def terminal(self, state):
+        # Returns the value of an arbitrary board state, 1 if the first player won, -1 if the
+        # second player won or 0 if the game is not over (see get_game_ended)
+        return self._get_game_value(self._load_scratch_board(state))
+
+    def get_current_state(self, out=None):
         # Returns the game state which is a tuple of:
         #   - 3D matrix of size L x H x W (layers, board height, board width)
         #   - integer (1 or -1) giving the value of the current player
-        board_state = np.copy(self.board.state)
+        # The board state is a new array unless out is given, in which case it is written into out
+        board_state = self.board.get_state(out)
         player_value = self.get_cur_player_value()
         return (board_state, player_value)
 
@@ -76,10 +132,41 @@ class ZertzGame():
             board_state, player_value = self.get_current_state()
         else:
             # Return the next state for an arbitrary marble supply, board and player
-            temp_game = ZertzGame(clone=self, clone_state=cur_state)
-            board_state, player_value = temp_game.get_next_state(action, action_type)
+            board_state = self.step(cur_state, action, action_type)
+            player_value = self.get_cur_player_value(self._scratch_board)
         return (board_state, player_value)
 
+    def make_move(self, action, action_type):
+        # Take the action on the game board in place and return an undo record. Unlike
+        # get_next_state no new state is created. Moves are undone with unmake_move in the
+        # reverse order that they were made.
+        return self.board.make_move(action, action_type)
+
+    def unmake_move(self, undo):
+        # Restore the game board to before the move that returned the undo record
+        self.board.unmake_move(undo)
+
+    def evaluate(self, out=None):
+        # Returns what a search needs to know about the current game state as a tuple of:
+        #   - 3D matrix of size L x H x W (layers, board height, board width), written into out if
+        #     it is given, or None if the game is over since the state is only needed to predict
+        #   - game value, 1 if first player won, -1 if second player won or 0 if not ended
+        #   - legal actions as a tuple of the action type and flat indices (see get_legal_actions)
+        #     or None if the game is over
+        #   - integer (1 or -1) giving the value of the current player
+        board = self.board
+        value = self._get_game_value(board)
+        if value != 0:
+            return (None, value, None, self.get_cur_player_value(board))
+        return (board.get_state(out), value, board.get_legal_actions(),
+                self.get_cur_player_value(board))
+
+    def make_move_and_evaluate(self, action, action_type, out=None):
+        # Take the action on the game board in place like make_move and evaluate the next state.
+        # Returns a tuple of the undo record for unmake_move followed by the values of evaluate.
+        undo = self.board.make_move(action, action_type)
+        return (undo,) + self.evaluate(out)
+
     def get_valid_actions(self, cur_state=None):
         # Returns two filtering matrices that can be used to filter and renormalize the policy
         # probability distributions. Capturing is compulsory so if there is a valid capture action
@@ -91,10 +178,45 @@ class ZertzGame():
             placement, capture = self.board.get_valid_moves()
         else:
             # Return the valid actions for an arbitrary marble supply, board and player
-            temp_game = ZertzGame(clone=self, clone_state=cur_state)
-            placement, capture = temp_game.get_valid_actions()
+            placement, capture = self._load_scratch_board(cur_state).get_valid_moves()
         return (placement, capture)
 
+    def get_legal_actions(self, cur_state=None):
+        # Returns the valid actions as a tuple of:
+        #   - action type, 'CAP' if there is a valid capture action (capturing is compulsory) or
+        #     else 'PUT'
+        #   - 1D array of flat indices of the valid actions into the action matrix of that type
+        # This is a compact alternative to get_valid_actions for when the filter matrices are not
+        # needed. The flat indices can be converted with np.unravel_index and the action shape.
+        if cur_state is None:
+            action_type, actions = self.board.get_legal_actions()
+        else:
+            action_type, actions = self.legal(cur_state)
+        return (action_type, actions)
+
+    def get_hash(self, cur_state=None):
+        # Returns the 64 bit Zobrist hash of the position which identifies the rings, marbles,
+        # capture layer, marble supply and current player (previous time steps are not included)
+        if cur_state is None:
+            value = self.board.get_hash()
+        else:
+            value = self._load_scratch_board(cur_state).get_hash()
+        return value
+
+    def pack_state(self, previous=None, cur_state=None):
+        # Returns a compact PackedState of the game state for storing many positions
+        #   - Optional: previous = the PackedState of the position before the last action, which
+        #     is used to rebuild the previous time steps instead of storing them again
+        #   - Optional: cur_state = an arbitrary board state to use instead of the current game state
+        if cur_state is None:
+            cur_state = self.board.get_state()
+        return PackedState(cur_state, previous)
+
+    def unpack_state(self, packed, out=None):
+        # Returns the full game state of a PackedState (see pack_state). If out is given then the
+        # state is written into it instead.
+        return packed.get_state(self.t, out)
+
     def get_capture_action_size(self):
         # Return the number of possible capture actions
         return 6 * self.board.width**2
@@ -111,48 +233,58 @@ class ZertzGame():
         # Return the shape of the placement actions as a tuple
         return self.board.get_placement_shape()
 
-    def _is_game_over(self):
+    def _build_win_table(self):
+        # Compile the win conditions into a lookup table of whether a player with the captured
+        # marbles [w, g, b] meets any win condition. Returns a tuple of:
+        #   - limits [w, g, b] = the most of each marble type required by any win condition
+        #   - table (limits + 1 nested lists) = True at [w][g][b] if the captured marbles win
+        # Having more marbles than the limit never changes the result so the captured counts are
+        # clipped to the limits before the lookup (see _is_game_over).
+        required = np.zeros((len(self.win_con), 3), dtype=np.intp)
+        for i, win_con in enumerate(self.win_con):
+            for j, marble_type in enumerate(['w', 'g', 'b']):
+                required[i, j] = win_con.get(marble_type, 0)
+        limits = np.max(required, axis=0) if len(self.win_con) else np.zeros(3, dtype=np.intp)
+        w, g, b = np.indices(limits + 1)
+        table = np.zeros(limits + 1, dtype=bool)
+        for need_w, need_g, need_b in required:
+            table |= (w >= need_w) & (g >= need_g) & (b >= need_b)
+        return limits.tolist(), table.tolist()
+
+    def _is_game_over(self, board):
         # Return True if ended or False if not ended
-        # Create lists to help index into the game state and win_con
-        marble_types = ['w', 'g', 'b']
-        captured_layers_start = [self.t * 4 + 4, self.t * 4 + 7]
-
-        # Check if any player's captured marbles are enough to satisfy a win condition
-        for win_con in self.win_con:
-            # Build the list of required marble amounts
-            required = np.zeros(3)
-            for i, marble_type in enumerate(marble_types):
-                if marble_type in win_con:
-                    required[i] = win_con[marble_type]
-
-            # Build the list of captured marble amounts for each player
-            for layer_start in captured_layers_start:
-                captured = self.board.state[layer_start: layer_start+3, 0, 0]
-                if np.all(captured >= required):
-                    return True
+        # Check if any player's captured marbles are enough to satisfy a win condition. The
+        # captured marbles are stored in the board supply after the 3 supply counts.
+        supply = board.supply
+        limit_w, limit_g, limit_b = self._win_limits
+        for start in (3, 6):
+            w, g, b = supply[start: start + 3]
+            if self._win_table[min(w, limit_w)][min(g, limit_g)][min(b, limit_b)]:
+                return True
 
         # If board has every ring covered with a marble then the last player who played is winner
-        if np.all(np.sum(self.board.state[:4], axis=0) != 1):
-            return True
-        return False
+        return board.is_full()
+
+    def _get_game_value(self, board):
+        # Return 1 if first player won, -1 if second player won or 0 if the game is not over
+        if self._is_game_over(board):
+            # The winner is the player that made the previous action
+            if not board.in_chain_capture():
+                return -1 * self.get_cur_player_value(board)
+            else:
+                # The game is over in the middle of the players turn during a chain capture
+                # if they have enough marbles to meet a win condition.
+                return self.get_cur_player_value(board)
+        return 0
 
     def get_game_ended(self, cur_state=None):
         # Returns 1 if first player won and -1 if second player won.
         # If no players have won then return 0.
         if cur_state is None:
-            if self._is_game_over():
-                # The winner is the player that made the previous action
-                if np.sum(self.board.state[self.board._CAPTURE_LAYER]) == 0:
-                    return -1 * self.get_cur_player_value()
-                else:
-                    # The game is over in the middle of the players turn during a chain capture
-                    # if they have enough marbles to meet a win condition.
-                    return self.get_cur_player_value()
-            return 0
+            return self._get_game_value(self.board)
         else:
             # Return if game is ended for an arbitrary game state
-            temp_game = ZertzGame(clone=self, clone_state=cur_state)
-            return temp_game.get_game_ended()
+            return self.terminal(cur_state)
 
     def get_symmetries(self, cur_state=None):
         # There are many symmetries in Zertz
@@ -162,38 +294,38 @@ class ZertzGame():
         # Third, there are translational symmetries once the board has gotten small enough that 
         # it can be shifted in one of the six directions and still be able to fit within the
         # original space.
-        # Total board symmetries = 6 * 2 * (# of shift symmetries)
-        # Total implemented currently = 4
+        # Fourth, the two players can be swapped by swapping their captured marbles and the
+        # current player.
+        # Total board symmetries = 6 * 2 * (# of shift symmetries) * 2
+        # Total implemented currently = 24 (every symmetry except shifts, including the identity)
+        # Returns a list of (symmetry, state) tuples
         if cur_state is None:
             symmetries = self.board.get_state_symmetries()
         else:
-            temp_game = ZertzGame(clone=self, clone_state=cur_state)
-            symmetries = temp_game.get_symmetries()
+            symmetries = [(symmetry, self.get_symmetry(symmetry, cur_state))
+                          for symmetry in xrange(self.get_num_symmetries())]
         return symmetries
 
-    def translate_action_symmetry(self, action_type, symmetry, actions):
-        translated = np.copy(actions)
-        if len(translated.shape) != 3:
-            if action_type == 'PUT':
-                translated = translated.reshape(self.get_placement_action_shape())
-            elif action_type == 'CAP':
-                translated = translated.reshape(self.get_capture_action_shape())
-        if symmetry == 0: # mirror
-            translated = self.board.mirror_action(action_type, translated)
-        elif symmetry == 1: # rotated
-            translated = self.board.rotate_action(action_type, translated)
-        elif symmetry == 2: # mirror/rotated
-            translated = self.board.mirror_action(action_type, translated)
-            translated = self.board.rotate_action(action_type, translated)
-        elif symmetry == 3: # opponent
-            pass
-        elif symmetry == 4: # opponent mirror
-            pass
-        elif symmetry == 5: # opponent rotated
-            pass
-        elif symmetry == 6: # opponent mirror/rotated
-            pass
-        return translated
+    def get_num_symmetries(self):
+        # Returns the number of symmetries, symmetry 0 is the identity
+        return self.board.get_num_symmetries()
+
+    def get_symmetry(self, symmetry, cur_state=None):
+        # Returns the state translated by a single symmetry
+        return self.board.translate_state(symmetry, cur_state)
+
+    def translate_action_symmetry(self, action_type, symmetry, actions, inverse=False):
+        # Returns the placement or capture action matrix translated by the symmetry. A policy that
+        # was predicted for a translated state is moved back to the original state with inverse.
+        # Each symmetry is a single gather using the tables of the board (see Board.translate_action)
+        return self.board.translate_action(action_type, symmetry, actions, inverse)
+
+    def translate_value_symmetry(self, symmetry, value):
+        # Returns the value of the game for a state translated by the symmetry. Values of states
+        # (the training labels and the network predictions) are from the point of view of the
+        # player to move. A player swap also swaps the captured marbles, so the player to move is
+        # in the same situation and no symmetry changes the value.
+        return value
 
     def str_to_action(self, action_str):
         # Translate an action string [i.e. 'PUT w A1 B2' or 'CAP b C4 g C2'] to a tuple/type
@@ -277,10 +409,10 @@ class ZertzGame():
         #   4 - black marble
         print "---------------"
         print "Board state:"
-        print (self.board.state[0] + self.board.state[1] + self.board.state[2] * 2
-                + self.board.state[3] * 3)
+        state = self.board.state
+        print (state[0] + state[1] + state[2] * 2 + state[3] * 3)
         print "---------------"
         print "Marble supply:"
-        print self.board.state[-10:-1, 0, 0]
+        print state[-10:-1, 0, 0]
         print "---------------"
 
@@ -1,9 +1,10 @@
 from collections import deque
 import copy
+import random
 import numpy as np
 
 
-class Board():
+class Board(object):
     # The zertz board is a hexagon and looks like this:
     #   A 2D array where each location is a ring
     #   Each ring is adjacent to the rings below, left, above/left, above, right, and down/right
@@ -36,6 +37,16 @@ class Board():
     _HEX_NUMBERS = [(1, 1), (7, 3), (19, 5), (37, 7), (61, 9), (91, 11), (127, 13)]
     #              (down), (left ), (u / l ), ( up ), (right), (d /r)
     _DIRECTIONS = [(1, 0), (0, -1), (-1, -1), (-1, 0), (0, 1), (1, 1)]
+    # Neighbor and jump lookup tables for each board width (see _get_tables)
+    _TABLES = {}
+    # Symmetry gather tables for each board width (see _get_symmetry_tables)
+    _SYMMETRY_TABLES = {}
+    # Number of rotations and mirrored rotations of the hexagonal board
+    _BOARD_SYMMETRIES = 12
+    # Zobrist hash keys for each board width (see _get_zobrist_keys)
+    _ZOBRIST_KEYS = {}
+    # Largest supported count for any entry of the supply when hashing
+    _MAX_MARBLES = 64
 
     def __init__(self, rings=37, marbles=None, t=1, clone=None):
         # Return a Board object to store the board state
@@ -50,7 +61,23 @@ class Board():
             self.t = clone.t
             self._CAPTURE_LAYER = clone._CAPTURE_LAYER
             self._MARBLE_TO_SUPPLY = copy.copy(clone._MARBLE_TO_SUPPLY)
-            self.state = np.copy(clone.state)
+            self._init_tables()
+            self._state = np.copy(clone._state)
+            self._head = clone._head
+            self.pieces = self._state[4 * self._head: 4 * self._head + 4]
+            self.supply = list(clone.supply)
+            self.player = clone.player
+            self._hash = clone._hash
+            self._num_open = clone._num_open
+            self._open_mask = np.copy(clone._open_mask)
+            self._removable_mask = np.copy(clone._removable_mask)
+            self._region_labels = None
+            self._region_log = None
+            if clone._region_labels is not None:
+                self._region_labels = list(clone._region_labels)
+                self._region_sizes = dict(clone._region_sizes)
+                self._region_empty = dict(clone._region_empty)
+                self._next_region_label = clone._next_region_label
         else:
             # Determine width of board from the number of rings
             self.rings = rings
@@ -61,6 +88,7 @@ class Board():
                 if total == self.rings:
                     self.width = width
             assert self.width != 0
+            self._init_tables()
 
             # Calculate the number of layers
             # 4 * t layers for all pieces going back t steps, 9 for supply, 1 for capture, 1 for player
@@ -81,15 +109,20 @@ class Board():
             #   -  t * 4 + 8 = player 2 gray marbles ([0, 10])
             #   -  t * 4 + 9 = player 2 black marbles ([0, 10])
             #   - t * 4 + 10 = current player (0 or 1)
+            # Only the ring and marble layers and the capture layer are stored as planes. The
+            # supply, captured marbles and current player are stored as integers (see get_state).
             self.t = t
-            layers = 4 * self.t + 11
             self._CAPTURE_LAYER = self.t * 4
             self._MARBLE_TO_SUPPLY = {'w': self.t * 4 + 1,
                                       'g': self.t * 4 + 2,
                                       'b': self.t * 4 + 3}
 
             # Initialize state as 3d array
-            self.state = np.zeros((layers, self.width, self.width), dtype=np.uint8)
+            self._state = np.zeros((4 * self.t + 1, self.width, self.width), dtype=np.uint8)
+            self._head = 0
+            self.pieces = self._state[0:4]
+            self._region_labels = None
+            self._region_log = None
 
             # Place rings
             # TODO: implement for uneven number of rings
@@ -97,18 +130,106 @@ class Board():
             for i in range(self.width):
                 lb = max(0, i - middle)
                 ub = min(self.width, middle + i + 1)
-                self.state[0, lb:ub, i] = 1
+                self.pieces[0, lb:ub, i] = 1
 
-            # Set the number of each type of marble available in the supply
+            # Set the number of each type of marble available in the supply followed by the
+            # number captured by player 1 and player 2 (same order as layers t * 4 + 1 to t * 4 + 9)
             #   default: 6x white, 8x gray, 10x black
             if marbles is None:
-                self.state[self._MARBLE_TO_SUPPLY['w']] = 6
-                self.state[self._MARBLE_TO_SUPPLY['g']] = 8
-                self.state[self._MARBLE_TO_SUPPLY['b']] = 10
+                self.supply = [6, 8, 10, 0, 0, 0, 0, 0, 0]
             else:
-                self.state[self._MARBLE_TO_SUPPLY['w']] = marbles['w']
-                self.state[self._MARBLE_TO_SUPPLY['g']] = marbles['g']
-                self.state[self._MARBLE_TO_SUPPLY['b']] = marbles['b']
+                self.supply = [marbles['w'], marbles['g'], marbles['b'], 0, 0, 0, 0, 0, 0]
+            self.player = 0
+            self._hash = self._compute_hash()
+            self._num_open = self._count_open_rings()
+            self._init_ring_masks()
+            self._label_regions()
+
+    def _init_tables(self):
+        # Use the lookup tables shared by every board with the same width
+        tables = self._get_tables(self.width)
+        self._neighbor_table, self._jump_table = tables[:2]
+        self._neighbor_lists, self._jump_lists = tables[2:]
+        self._zobrist_keys = self._get_zobrist_keys(self.width)
+
+    @classmethod
+    def _get_zobrist_keys(cls, width):
+        # Return the random 64 bit keys used to hash positions on a board of the given width:
+        #   - piece keys (4 x w^2) = key for the ring and each marble layer at each location
+        #   - capture keys (w^2) = key for the capturing marble at each location
+        #   - supply keys (9 x _MAX_MARBLES + 1) = key for each count of each supply index
+        #   - player key = key included when it is the second player's turn
+        # The keys use a fixed seed so the hash of a position is the same in every process.
+        if width not in cls._ZOBRIST_KEYS:
+            rng = random.Random(width)
+            size = width * width
+            pieces = [[rng.getrandbits(64) for _ in range(size)] for _ in range(4)]
+            capture = [rng.getrandbits(64) for _ in range(size)]
+            supply = [[rng.getrandbits(64) for _ in range(cls._MAX_MARBLES + 1)] for _ in range(9)]
+            player = rng.getrandbits(64)
+            cls._ZOBRIST_KEYS[width] = (pieces, capture, supply, player)
+        return cls._ZOBRIST_KEYS[width]
+
+    def _compute_hash(self):
+        # Return the Zobrist hash of the current position from scratch. The hash covers the rings,
+        # marbles, capture layer, supply and current player but not the previous time steps.
+        piece_keys, capture_keys, supply_keys, player_key = self._zobrist_keys
+        value = 0
+        layers = self.pieces.reshape(4, self.width**2)
+        for layer in range(4):
+            for loc in np.flatnonzero(layers[layer]).tolist():
+                value ^= piece_keys[layer][loc]
+        for loc in np.flatnonzero(self._state[self._CAPTURE_LAYER]).tolist():
+            value ^= capture_keys[loc]
+        for index, count in enumerate(self.supply):
+            value ^= supply_keys[index][count]
+        if self.player == 1:
+            value ^= player_key
+        return value
+
+    def _count_open_rings(self):
+        # Return the number of rings without a marble counted from scratch. The count is kept in
+        # _num_open and updated as marbles are placed, captured and rings are removed.
+        return int(np.count_nonzero(np.sum(self.pieces, axis=0) == 1))
+
+    def get_num_rings(self):
+        # Return the number of rings left on the board
+        return int(np.count_nonzero(self.pieces[0]))
+
+    def get_hash(self):
+        # Return the 64 bit Zobrist hash of the current position. It is updated as actions are
+        # taken so positions can be identified without hashing the state array.
+        return self._hash
+
+    def _add_supply(self, index, count):
+        # Add count (may be negative) marbles to an entry of the supply and update the hash
+        supply_keys = self._zobrist_keys[2][index]
+        old_count = self.supply[index]
+        self.supply[index] = old_count + count
+        self._hash ^= supply_keys[old_count] ^ supply_keys[old_count + count]
+
+    @classmethod
+    def _get_tables(cls, width):
+        # Return the lookup tables for a board of the given width. Locations are flat indices
+        # (y * width + x) and the tables are built once for each board width:
+        #   - neighbor table (w^2 x 6) = index of the neighbor in each of the _DIRECTIONS
+        #   - jump table (w^2 x 6) = index of the landing location after jumping the neighbor
+        # Neighbors and jump destinations that are not inbounds are given the index w^2 so that
+        # lookups into a flattened layer padded with a 0 at the end never count them as rings.
+        # The tables are also stored as nested lists for fast scalar lookups.
+        if width not in cls._TABLES:
+            size = width * width
+            neighbors = np.full((size, 6), size, dtype=np.intp)
+            jumps = np.full((size, 6), size, dtype=np.intp)
+            for y in range(width):
+                for x in range(width):
+                    for direction, (dy, dx) in enumerate(cls._DIRECTIONS):
+                        if 0 <= y + dy < width and 0 <= x + dx < width:
+                            neighbors[y * width + x, direction] = (y + dy) * width + x + dx
+                        if 0 <= y + 2 * dy < width and 0 <= x + 2 * dx < width:
+                            jumps[y * width + x, direction] = (y + 2 * dy) * width + x + 2 * dx
+            cls._TABLES[width] = (neighbors, jumps, neighbors.tolist(), jumps.tolist())
+        return cls._TABLES[width]
 
     def _get_middle_ring(self, src, dst):
         # Return the (y, x) index of the ring between src and dst
@@ -143,56 +264,249 @@ class Board():
         y, x = index
         return 0 <= y < self.width and 0 <= x < self.width
 
+    @property
+    def state(self):
+        return self.get_state()
+
+    @state.setter
+    def state(self, state):
+        # The first 4 * t layers of the stored state are used as a ring buffer of the ring and
+        # marble layers for the last t steps. _head is the index of the current step and previous
+        # steps follow it, wrapping around to the start. An assigned state is in time order which
+        # is the same as the ring buffer with _head = 0.
+        history = 4 * self.t
+        self._state = state[:history + 1]
+        self._head = 0
+        self.pieces = self._state[0:4]
+        # The layers after the capture layer are constant so only one value of each is kept
+        self.supply = [int(count) for count in state[history + 1: history + 10, 0, 0]]
+        self.player = int(state[history + 10, 0, 0])
+        self._hash = self._compute_hash()
+        self._num_open = self._count_open_rings()
+        self._init_ring_masks()
+        # The regions are tracked incrementally as actions are taken. When a new state is assigned
+        # they are labeled again the next time they are needed (see _get_region_labels).
+        self._region_labels = None
+
+    def get_state(self, out=None):
+        # Return the L x H x W state with the ring and marble layers in time order. If out is given
+        # then the state is written into it instead (i.e. one entry of a batch of network inputs).
+        history = 4 * self.t
+        if out is None:
+            out = np.empty((history + 11, self.width, self.width), dtype=np.uint8)
+        # Steps from _head to the end of the ring buffer followed by the steps that wrapped around
+        split = history - 4 * self._head
+        out[:split] = self._state[4 * self._head: history]
+        out[split: history] = self._state[:4 * self._head]
+        out[history] = self._state[history]
+        # Broadcast the supply, captured marbles and current player to full layers
+        out[history + 1: history + 10] = np.array(self.supply, dtype=np.uint8)[:, None, None]
+        out[history + 10] = self.player
+        return out
+
+    def _get_region_labels(self):
+        # Return a list with the label of the continuous region of rings at each location (-1 if
+        # there is no ring). The list has an extra -1 at the end for lookups of the out of bounds
+        # index w^2 in the neighbor tables, so it is also a padded mask of the rings. Along with
+        # the labels the board tracks:
+        #   - _region_sizes = dict of region label to the number of rings in the region
+        #   - _region_empty = dict of region label to the number of rings without a marble
+        # The regions are labeled from scratch only when a board is created or a state is assigned
+        # and after that they are updated by the actions (including the undo of make_move).
+        if self._region_labels is None:
+            self._label_regions()
+        return self._region_labels
+
+    def _label_regions(self):
+        # Label every region of the board from scratch with a search from each unlabeled ring
+        rings, occupied = self._get_padded_masks()
+        rings = rings.tolist()
+        occupied = occupied.tolist()
+        labels = [-1] * (self.width**2 + 1)
+        self._region_sizes = {}
+        self._region_empty = {}
+        label = 0
+        for start in range(self.width**2):
+            if not rings[start] or labels[start] != -1:
+                continue
+            # Add all rings that can be reached from the starting ring to a new region
+            labels[start] = label
+            region = [start]
+            for loc in region:
+                for neighbor in self._neighbor_lists[loc]:
+                    if rings[neighbor] and labels[neighbor] == -1:
+                        labels[neighbor] = label
+                        region.append(neighbor)
+            self._region_sizes[label] = len(region)
+            self._region_empty[label] = len(region) - sum(occupied[loc] for loc in region)
+            label += 1
+        self._region_labels = labels
+        self._next_region_label = label
+
     def _get_regions(self):
         # Return a list of continuous regions on the board. A region consists of a list of indices.
         # If any index can be reached from any other index then this will return a list of length 1.
-        regions = []
-        not_visited = set(zip(*np.where(self.state[0] == 1)))
-        while not_visited:
-            # While there are indices that have not been added to a region start a new empty region
-            region = []
-            queue = deque()
-            queue.appendleft(not_visited.pop())
-            # Add all indices to the region that can be reached from the starting index
-            while queue:
-                index = queue.pop()
-                region.append(index)
-                # Add all neighbors to the queue and mark visited to add them to the same region
-                for neighbor in self._get_neighbors(index):
-                    if (neighbor in not_visited
-                            and self._is_inbounds(neighbor)
-                            and self.state[0][neighbor] != 0):
-                        not_visited.remove(neighbor)
-                        queue.appendleft(neighbor)
-            regions.append(region)
-        return regions
+        labels = self._get_region_labels()
+        regions = dict((label, []) for label in self._region_sizes)
+        for loc, label in enumerate(labels):
+            if label != -1:
+                regions[label].append((loc // self.width, loc % self.width))
+        return list(regions.values())
+
+    def _remove_region_ring(self, loc):
+        # Update the tracked regions after the empty ring at loc has been removed from the board.
+        # Return a list with the labels of any regions that were split off by the removal.
+        labels = self._get_region_labels()
+        label = labels[loc]
+        self._set_region_label(loc, -1)
+        if self._region_sizes[label] == 1:
+            self._set_region_counts(label, None, None)
+            return []
+        self._set_region_counts(label, self._region_sizes[label] - 1, self._region_empty[label] - 1)
+
+        # The remaining neighbors of the removed ring form runs of consecutive directions. Rings in
+        # the same run are adjacent to each other so the region can only be split if there is
+        # more than one run.
+        size = self.width**2
+        neighbors = self._neighbor_lists[loc]
+        present = [neighbor != size and labels[neighbor] == label for neighbor in neighbors]
+        starts = [neighbors[d] for d in range(6) if present[d] and not present[d - 1]]
+        if len(starts) < 2:
+            return []
+
+        # Search outward from one ring of each run at the same time, one ring per search in turn.
+        # Searches that reach each other are merged. A search that runs out of rings has found a
+        # region that was split off. Once only one search is left the rest of the old region
+        # must belong to it, so only the rings of the smaller regions are ever visited.
+        owner = dict((start, i) for i, start in enumerate(starts))
+        parent = list(range(len(starts)))
+        queues = [deque([start]) for start in starts]
+        members = [[start] for start in starts]
+        active = list(range(len(starts)))
+        split = []
+        while len(active) > 1:
+            for search in list(active):
+                if search not in active:
+                    continue
+                if not queues[search]:
+                    active.remove(search)
+                    split.append(search)
+                    if len(active) == 1:
+                        break
+                    continue
+                for neighbor in self._neighbor_lists[queues[search].popleft()]:
+                    if neighbor == size or labels[neighbor] != label:
+                        continue
+                    other = owner.get(neighbor)
+                    if other is None:
+                        owner[neighbor] = search
+                        queues[search].append(neighbor)
+                        members[search].append(neighbor)
+                        continue
+                    while parent[other] != other:
+                        other = parent[other]
+                    if other != search:
+                        # Both searches are in the same region so continue them as one search
+                        parent[other] = search
+                        queues[search].extend(queues[other])
+                        members[search].extend(members[other])
+                        active.remove(other)
+
+        # Give each split off region a new label. Every member is a ring so the empty ones are
+        # the open rings.
+        new_labels = []
+        for search in split:
+            new_label = self._next_region_label
+            self._next_region_label += 1
+            for member in members[search]:
+                self._set_region_label(member, new_label)
+            num_empty = int(np.count_nonzero(self._open_mask[members[search]]))
+            self._set_region_counts(new_label, len(members[search]), num_empty)
+            self._set_region_counts(label, self._region_sizes[label] - len(members[search]),
+                                    self._region_empty[label] - num_empty)
+            new_labels.append(new_label)
+        return new_labels
+
+    def _set_region_label(self, loc, label):
+        # Change the region label of a location. While a move is being made the old label is
+        # recorded so that unmake_move can restore it (see make_move).
+        if self._region_log is not None:
+            self._region_log[0].append((loc, self._region_labels[loc]))
+        self._region_labels[loc] = label
+
+    def _set_region_counts(self, label, size, num_empty):
+        # Set the number of rings and empty rings of a region, or remove the region if size is
+        # None. While a move is being made the old counts are recorded (see make_move).
+        if self._region_log is not None:
+            self._region_log[1].append((label, self._region_sizes.get(label),
+                                        self._region_empty.get(label)))
+        if size is None:
+            del self._region_sizes[label]
+            del self._region_empty[label]
+        else:
+            self._region_sizes[label] = size
+            self._region_empty[label] = num_empty
+
+    def _capture_region(self, label):
+        # Remove all rings in the region and give the marbles to the current player
+        labels = self._region_labels
+        region = [loc for loc, region_label in enumerate(labels) if region_label == label]
+        layers = self.pieces.reshape(4, self.width**2)
+        captured = np.sum(layers[1:4, region], axis=1)
+        for marble_type, count in zip(['w', 'g', 'b'], captured):
+            if count:
+                self._add_supply(self._get_cur_player_supply_index(marble_type), int(count))
+        # Set the ring and marble layers all to 0
+        piece_keys = self._zobrist_keys[0]
+        for layer, i in zip(*np.nonzero(layers[:, region])):
+            self._hash ^= piece_keys[layer][region[i]]
+        layers[:, region] = 0
+        for loc in region:
+            self._set_region_label(loc, -1)
+        self._set_region_counts(label, None, None)
+        # Every captured ring had a marble and the neighbors of the region are not rings so the
+        # open and removable ring masks do not change
 
     def get_cur_player(self):
-        return self.state[self.t * 4 + 10, 0, 0]
+        return self.player
+
+    def get_captured(self, player):
+        # Return the number of captured marbles [w, g, b] for player (0 or 1)
+        start = 3 + 3 * player
+        return self.supply[start: start+3]
+
+    def in_chain_capture(self):
+        # Return True if the current player is in the middle of a forced chain capture
+        return np.sum(self._state[self._CAPTURE_LAYER]) != 0
+
+    def is_full(self):
+        # Return True if every ring on the board is covered with a marble
+        return self._num_open == 0
 
     def _next_player(self):
-        self.state[self.t * 4 + 10] = (self.state[self.t * 4 + 10] + 1) % 2
+        self.player = (self.player + 1) % 2
+        self._hash ^= self._zobrist_keys[3]
     
-    def _get_cur_player_supply_layer(self, marble_type):
-        # Return the layer index for the captured marble type and the current player
+    def _get_cur_player_supply_index(self, marble_type):
+        # Return the index in supply for the captured marble type and the current player
         # Input: captured_type = 'w', 'g', or 'b'
-        supply_layer = self._MARBLE_TO_SUPPLY[marble_type]
-        if self.get_cur_player() == 0:
-            supply_layer += 3
-        else:
-            supply_layer += 6
-        return supply_layer
+        return 3 + 3 * self.player + self._MARBLE_TO_LAYER[marble_type] - 1
 
     def _get_marble_type_at(self, index):
         y, x = index
-        marble_type = self._LAYER_TO_MARBLE[np.argmax(self.state[1:4, y, x]) + 1]
+        marble_type = self._LAYER_TO_MARBLE[np.argmax(self.pieces[1:4, y, x]) + 1]
         return marble_type
 
     def take_action(self, action, action_type):
         # Input: action is an index into the action space matrix
         #        action_type is 'PUT' or 'CAP'
-        # Push back the previous t states and copy the most recent state to the top 4 layers
-        self.state[0: 4*self.t] = np.concatenate([self.state[0:4], self.state[0: 4*(self.t-1)]], axis=0)
+        # Move the head of the ring buffer back one step, overwriting the oldest step, and copy the
+        # most recent ring and marble layers to it
+        if self.t > 1:
+            head = (self._head - 1) % self.t
+            self._state[4 * head: 4 * head + 4] = self.pieces
+            self._head = head
+            self.pieces = self._state[4 * head: 4 * head + 4]
 
         # Modify the most recent 4 layers of the state based on the action
         if action_type == 'PUT':
@@ -200,6 +514,59 @@ class Board():
         elif action_type == 'CAP':
             self.take_capture_action(action)
 
+    def make_move(self, action, action_type):
+        # Take the action in place and return an undo record for unmake_move. Moves must be undone
+        # in the reverse order that they were made. The record holds:
+        #   - the previous head of the ring buffer
+        #   - the ring and marble layers at the new head (the oldest time step, or the current one
+        #     when t = 1) and the capture layer before the action. Together these cover any removed
+        #     ring, jumped or isolated marbles and the chain capture marker.
+        #   - the supply, current player, hash and number of open rings before the action
+        #   - the open and removable ring masks before the action
+        #   - the region labels and region counts changed by the action along with their old
+        #     values, and the next unused region label before the action
+        # The regions are labeled before the action if they have not been yet so that they stay
+        # labeled after the move is undone, and only their changes need to be recorded.
+        head = (self._head - 1) % self.t
+        layers = [4 * head, 4 * head + 1, 4 * head + 2, 4 * head + 3, self._CAPTURE_LAYER]
+        self._get_region_labels()
+        undo = (self._head, self._state[layers], list(self.supply), self.player, self._hash,
+                self._num_open, np.copy(self._open_mask), np.copy(self._removable_mask),
+                self._next_region_label)
+        self._region_log = ([], [])
+        self.take_action(action, action_type)
+        label_log, count_log = self._region_log
+        self._region_log = None
+        return undo + (label_log, count_log)
+
+    def unmake_move(self, undo):
+        # Restore the board to before the move that returned the undo record (see make_move)
+        head, planes, supply, player, value, num_open, open_mask, removable_mask = undo[:8]
+        next_region_label, label_log, count_log = undo[8:]
+        layers = [4 * self._head, 4 * self._head + 1, 4 * self._head + 2, 4 * self._head + 3,
+                  self._CAPTURE_LAYER]
+        self._state[layers] = planes
+        self._head = head
+        self.pieces = self._state[4 * head: 4 * head + 4]
+        self.supply = supply
+        self.player = player
+        self._hash = value
+        self._num_open = num_open
+        self._open_mask = open_mask
+        self._removable_mask = removable_mask
+        # Undo the changes to the regions in reverse order
+        for label, size, num_empty in reversed(count_log):
+            if size is None:
+                del self._region_sizes[label]
+                del self._region_empty[label]
+            else:
+                self._region_sizes[label] = size
+                self._region_empty[label] = num_empty
+        labels = self._region_labels
+        for loc, label in reversed(label_log):
+            labels[loc] = label
+        self._next_region_label = next_region_label
+
     def take_placement_action(self, action):
         # Placement actions have dimension (3 x w^2 x w^2 + 1)
         # Translate the action dimensions into marble_type, put_index, and rem_index
@@ -213,54 +580,47 @@ class Board():
 
         # Place the marble on the board
         y, x = put_index
-        assert np.sum(self.state[:4, y, x]) == 1
+        assert np.sum(self.pieces[:, y, x]) == 1
+        labels = self._get_region_labels()
         put_layer = self._MARBLE_TO_LAYER[marble_type] 
-        self.state[put_layer][put_index] = 1
+        self.pieces[put_layer][put_index] = 1
+        label = labels[put_loc]
+        self._set_region_counts(label, self._region_sizes[label], self._region_empty[label] - 1)
+        self._num_open -= 1
+        self._open_mask[put_loc] = False
+        self._removable_mask[put_loc] = False
+        piece_keys = self._zobrist_keys[0]
+        self._hash ^= piece_keys[put_layer][put_loc]
 
         # Remove the marble from the supply
-        supply_layer = self._MARBLE_TO_SUPPLY[marble_type]
-        if self.state[supply_layer, 0, 0] >= 1:
-            self.state[supply_layer] -= 1
+        supply_index = put_layer - 1
+        if self.supply[supply_index] >= 1:
+            self._add_supply(supply_index, -1)
         else:
             # If supply is empty then take the marble from those the player has captured
-            supply_layer = self._get_cur_player_supply_layer(marble_type)
-            assert self.state[supply_layer, 0, 0] >= 1
-            self.state[supply_layer] -= 1
+            supply_index = self._get_cur_player_supply_index(marble_type)
+            assert self.supply[supply_index] >= 1
+            self._add_supply(supply_index, -1)
 
         # Remove the ring from the board
         if rem_index is not None:
-            self.state[0][rem_index] = 0
-            # Check if it is possbile for the board to have been separated into regions. This is only 
-            # possible if two of the empty neighbors are opposites.
-            opposite_empty = False
-            for neighbor in self._get_neighbors(rem_index)[:3]:
-                opposite = self._get_jump_dst(neighbor, rem_index)
-                if ((not self._is_inbounds(neighbor) or self.state[0][neighbor] == 0)
-                        and (not self._is_inbounds(opposite) or self.state[0][opposite] == 0)):
-                    opposite_empty = True
-                    break
-            if opposite_empty:
-                # Get list of regions
-                regions = self._get_regions()
-                # If the board has been separated into multiple regions then check if any are captured
-                if len(regions) > 1:
-                    for region in regions:
-                        captured = True
-                        # A region is captured if every ring in the region is occupied by a marble
-                        for y, x in region:
-                            if np.sum(self.state[1:4, y, x]) == 0:
-                                captured = False
-                                break
-                        if captured:
-                            # Remove all rings in the captured region and give the marbles to the player
-                            for index in region:
-                                y, x = index
-                                if np.sum(self.state[1:4, y, x]) == 1:
-                                    captured_type = self._get_marble_type_at(index)
-                                supply_layer = self._get_cur_player_supply_layer(captured_type)
-                                self.state[supply_layer] += 1
-                                # Set the ring and marble layers all to 0
-                                self.state[0:4, y, x] = 0
+            self.pieces[0][rem_index] = 0
+            self._hash ^= piece_keys[0][rem_loc]
+            self._num_open -= 1
+            self._open_mask[rem_loc] = False
+            self._removable_mask[rem_loc] = False
+            self._remove_region_ring(rem_loc)
+            # The neighbors of the removed ring are the only rings that may have become removable
+            self._update_removable(self._neighbor_lists[rem_loc])
+
+        # If the board has been separated into multiple regions then any region with every ring
+        # occupied by a marble is captured. This includes regions that were separated earlier
+        # and have just had their last empty ring filled. The captured regions have no open rings
+        # so the number of open rings does not change.
+        if len(self._region_sizes) > 1:
+            for label, num_empty in list(self._region_empty.items()):
+                if num_empty == 0:
+                    self._capture_region(label)
 
         # Update current player
         self._next_player()
@@ -271,48 +631,64 @@ class Board():
         direction, y, x = action
         src_index = (y, x)
         marble_type = self._get_marble_type_at(src_index)
-        dy, dx = self._DIRECTIONS[direction]
-        cap_index = (y + dy, x + dx)
-        dst_index = self._get_jump_dst(src_index, cap_index)
+        src_loc = y * self.width + x
+        cap_loc = self._neighbor_lists[src_loc][direction]
+        dst_loc = self._jump_lists[src_loc][direction]
+        cap_index = (cap_loc // self.width, cap_loc % self.width)
+        dst_index = (dst_loc // self.width, dst_loc % self.width)
         y, x = cap_index
+        labels = self._get_region_labels()
 
-        if np.sum(self.state[1:4, y, x]) != 1:
-            import pdb; pdb.set_trace()
+        piece_keys, capture_keys = self._zobrist_keys[:2]
 
-        # Reset the capture layer
-        self.state[self._CAPTURE_LAYER] = 0
+        # Reset the capture layer. During a chain capture the only legal capture is by the marked
+        # marble so the marker can only be at the source.
+        if self._state[self._CAPTURE_LAYER][src_index]:
+            self._state[self._CAPTURE_LAYER][src_index] = 0
+            self._hash ^= capture_keys[src_loc]
 
         # Remove capturing marble from src_index and place it at dst_index
         marble_layer = self._MARBLE_TO_LAYER[marble_type] 
-        self.state[marble_layer][src_index] = 0
-        self.state[marble_layer][dst_index] = 1
+        self.pieces[marble_layer][src_index] = 0
+        self.pieces[marble_layer][dst_index] = 1
+        self._hash ^= piece_keys[marble_layer][src_loc] ^ piece_keys[marble_layer][dst_loc]
 
         # Give the captured marble to the current player and remove it from the board
-#        y, x = cap_index
-#
-#        if np.sum(self.state[1:4, y, x]) != 1:
-#            import pdb; pdb.set_trace()
-        assert np.sum(self.state[1:4, y, x]) == 1
+        assert np.sum(self.pieces[1:4, y, x]) == 1
         captured_type = self._get_marble_type_at(cap_index)
-        supply_layer = self._get_cur_player_supply_layer(captured_type)
-        self.state[supply_layer] += 1
-        self.state[1:4, y, x] = 0
+        self._add_supply(self._get_cur_player_supply_index(captured_type), 1)
+        self.pieces[1:4, y, x] = 0
+        self._hash ^= piece_keys[self._MARBLE_TO_LAYER[captured_type]][cap_loc]
+        label = labels[cap_loc]
+        self._set_region_counts(label, self._region_sizes[label], self._region_empty[label] + 1)
+        # The jump moves the marble from one ring to another so only the captured ring is opened
+        self._num_open += 1
         
+        # The source and captured rings are now open and the destination is not. No rings were
+        # removed so no other ring can change whether it is removable.
+        self._open_mask[src_loc] = True
+        self._open_mask[cap_loc] = True
+        self._open_mask[dst_loc] = False
+        self._removable_mask[dst_loc] = False
+        self._update_removable([src_loc, cap_loc])
+
         # Update the capture layer if there is a forced chain capture
-        neighbors = self. _get_neighbors(dst_index)
-        for neighbor in neighbors:
-            y, x = neighbor
-            # Check each neighbor to see if it has a marble
-            if self._is_inbounds(neighbor) and np.sum(self.state[1:4, y, x]) == 1:
-                next_dst = self._get_jump_dst(dst_index, neighbor)
-                y, x = next_dst
-                if self._is_inbounds(next_dst) and np.sum(self.state[:4, y, x]) == 1:
-                    # Set the captured layer to 1 at dst_index
-                    self.state[self._CAPTURE_LAYER][dst_index] = 1
-                    break
+        size = self.width**2
+        open_mask = self._open_mask
+        chain_capture = False
+        for neighbor, next_dst in zip(self._neighbor_lists[dst_loc], self._jump_lists[dst_loc]):
+            # Check each neighbor to see if it has a marble (a ring that isn't open) and the jump
+            # destination is an open ring. Only the cells next to dst are looked at.
+            if next_dst != size and labels[neighbor] != -1 and not open_mask[neighbor] and \
+                    open_mask[next_dst]:
+                # Set the captured layer to 1 at dst_index
+                self._state[self._CAPTURE_LAYER][dst_index] = 1
+                self._hash ^= capture_keys[dst_loc]
+                chain_capture = True
+                break
 
         # Update current player if there are no forced chain captures
-        if np.sum(self.state[self._CAPTURE_LAYER]) == 0:
+        if not chain_capture:
             self._next_player()
 
     def get_valid_moves(self):
@@ -326,6 +702,17 @@ class Board():
             placement = self.get_placement_moves()
         return (placement, capture)
 
+    def get_legal_actions(self):
+        # Return the valid actions as a tuple of:
+        #   - action type, 'CAP' if there is a valid capture (capturing is compulsory) or else 'PUT'
+        #   - 1D array of flat indices of the valid actions into the action matrix of that type
+        #     (see get_placement_shape and get_capture_shape) in increasing order
+        # Unlike get_valid_moves this does not allocate the full placement matrix.
+        capture = self.get_capture_moves()
+        if np.any(capture):
+            return ('CAP', np.flatnonzero(capture))
+        return ('PUT', self._build_placement_actions(*self._get_placement_masks()))
+
     def get_placement_shape(self):
         # get shape of placement moves as a tuple
         return (3, self.width**2, self.width**2 + 1)
@@ -339,193 +726,266 @@ class Board():
         # every index that corresponds to a valid placement action.
         # Marble types correspond to the following indices {'w':0, 'g':1, 'b':2}
         # A ring removal value of w^2 indicates no ring is removed
-        moves = np.zeros((3, self.width**2, self.width**2 + 1), dtype=bool)
+        return self._build_placement_moves(*self._get_placement_masks())
 
-        # Build list of open and removable rings for marble placement and ring removal
-        open_rings = list(self._get_open_rings())
-        removable_rings = list(self._get_removable_rings())
+    def _get_placement_masks(self):
+        # Return the number of each marble type that can be placed and flattened (w^2) boolean
+        # masks of the open and removable rings for marble placement and ring removal
+        open_mask = self._open_mask
+        removable_mask = self._removable_mask
 
         # Get list of marble types that can be placed. If supply is empty then
         # the player must use a captured marble.
-        supply_start = self._MARBLE_TO_SUPPLY['w']
-        if np.all(self.state[supply_start : supply_start+3, 0, 0] == 0):
-            if self.state[14, 0, 0] == 0:
-                supply_start += 3
-            else:
-                supply_start += 6
-
-        # Assign 1 to all indices that are valid actions
-        for m, marble_count in enumerate(self.state[supply_start: supply_start+3, 0, 0]):
-            if marble_count == 0:
-                continue
-            for put_index in open_rings:
-                put = put_index[0] * self.width + put_index[1]
-                for rem_index in removable_rings:
-                    rem = rem_index[0] * self.width + rem_index[1]
-                    if put != rem:
-                        moves[m, put, rem] = True
-                # If there are no removable rings then you are not required to remove one
-                if not removable_rings or (len(removable_rings) == 1 and removable_rings[0] == put_index):
-                    rem = self.width**2
-                    moves[m, put, rem] = True
+        marble_counts = self.supply[0:3]
+        if not any(marble_counts):
+            marble_counts = self.get_captured(self.player)
+        return marble_counts, open_mask, removable_mask
+
+    def _build_placement_moves(self, marble_counts, open_mask, removable_mask):
+        # Return the (3 x w^2 x w^2 + 1) placement matrix from the number of each marble type that
+        # can be placed and flattened (w^2) boolean masks of the open and removable rings
+        size = self.width**2
+        moves = np.zeros((3, size, size + 1), dtype=bool)
+        marble_mask = np.asarray(marble_counts) > 0
+
+        # Any marble that can be placed on any open ring while removing any removable ring
+        np.logical_and(open_mask[:, None], removable_mask[None, :], out=moves[0, :, :size])
+        # A marble can not be placed on the ring that is removed
+        moves[0, np.arange(size), np.arange(size)] = False
+
+        # If there are no removable rings then you are not required to remove one. This is also
+        # the case when the only removable ring is the one the marble is placed on.
+        num_removable = np.count_nonzero(removable_mask)
+        if num_removable == 0:
+            moves[0, :, size] = open_mask
+        elif num_removable == 1:
+            moves[0, :, size] = open_mask & removable_mask
+
+        # Copy the moves to each marble type that is available
+        moves[1:] = moves[0]
+        moves &= marble_mask[:, None, None]
         return moves
 
+    def _build_placement_actions(self, marble_counts, open_mask, removable_mask):
+        # Return the flat indices of the True values of the matrix from _build_placement_moves
+        size = self.width**2
+        open_locs = np.flatnonzero(open_mask)
+        removable_locs = np.flatnonzero(removable_mask)
+
+        # Pair every open ring with every removable ring followed by no removal
+        rem_locs = np.append(removable_locs, size)
+        valid = open_locs[:, None] != rem_locs[None, :]
+        if len(removable_locs) > 1:
+            valid[:, -1] = False
+        elif len(removable_locs) == 1:
+            valid[:, -1] = open_locs == removable_locs[0]
+        actions = (open_locs[:, None] * (size + 1) + rem_locs[None, :])[valid]
+
+        # Repeat the actions for each marble type that is available
+        marble_types = np.flatnonzero(np.asarray(marble_counts) > 0)
+        return (marble_types[:, None] * (size * (size + 1)) + actions[None, :]).ravel()
+
     def get_capture_moves(self):
         # Return a boolean matrix of size (6 x w x w) with the value True at
         # every index that corresponds to a valid capture action.
         # The six directions are given by self._DIRECTIONS
-        moves = np.zeros((6, self.width, self.width), dtype=bool)
+        rings, occupied = self._get_padded_masks()
+        empty = rings & ~occupied
 
-        # Create list of the indices of marbles that can be used to capture
-        if np.sum(self.state[self._CAPTURE_LAYER]) == 1:
-            occupied_rings = zip(*np.where(self.state[self._CAPTURE_LAYER] == 1))
+        # Marbles that can be used to capture, only the marked marble during a chain capture
+        if np.sum(self._state[self._CAPTURE_LAYER]) == 1:
+            sources = self._state[self._CAPTURE_LAYER].ravel() == 1
         else:
-            occupied_rings = zip(*np.where(np.sum(self.state[1:4], axis=0) == 1))
-
-        # Update matrix with all possible capture directions from each capturing marble
-        for src_index in occupied_rings:
-            src_y, src_x = src_index
-            neighbors = self._get_neighbors(src_index)
-            for direction, neighbor in enumerate(neighbors):
-                # Check each neighbor to see if it has a marble and the jump destination is empty
-                y, x = neighbor
-                if self._is_inbounds(neighbor) and np.sum(self.state[1:4, y, x]) == 1:
-                    dst_index = self._get_jump_dst(src_index, neighbor)
-                    y, x = dst_index
-                    if self._is_inbounds(dst_index) and np.sum(self.state[:4, y, x]) == 1:
-                        # Set this move as a valid action in the filter matrix
-                        moves[direction, src_y, src_x] = True
-        return moves
+            sources = occupied[:-1]
+
+        # Shift the occupied and empty masks by one and two steps in each direction using the
+        # neighbor and jump tables. A marble can capture in a direction if the neighbor has a
+        # marble and the jump destination is an empty ring.
+        moves = sources[:, None] & occupied[self._neighbor_table] & empty[self._jump_table]
+        return moves.T.reshape(6, self.width, self.width)
+
+    def _get_padded_masks(self):
+        # Return flattened (w^2 + 1) boolean masks of the rings and the rings with marbles. The
+        # extra False at the end is used by lookups of locations that are out of bounds.
+        rings = np.zeros(self.width**2 + 1, dtype=bool)
+        occupied = np.zeros(self.width**2 + 1, dtype=bool)
+        rings[:-1] = self.pieces[0].ravel()
+        np.any(self.pieces[1:4], axis=0, out=occupied[:-1].reshape(self.width, self.width))
+        return rings, occupied
 
     def _get_open_rings(self):
         # Return a list of indices for all of the open rings
-        open_rings = zip(*np.where(np.sum(self.state[:4], axis=0) == 1))
+        open_rings = zip(*np.where(np.sum(self.pieces, axis=0) == 1))
         return open_rings
 
+    def _get_removable_mask(self, rings=None, occupied=None):
+        # Return a flattened (w^2) boolean mask of the rings that can be removed. A ring is
+        # removable if two of its neighbors in a row are missing and the ring itself is empty.
+        # Optional: rings, occupied = the padded masks from _get_padded_masks
+        if rings is None:
+            rings, occupied = self._get_padded_masks()
+        # Gather the missing neighbors of every location in each of the _DIRECTIONS. The directions
+        # are in order around the ring, so rolling by one pairs each direction with the next one
+        # (and the last with the first) and a pair that are both missing makes the ring removable.
+        missing = ~rings[self._neighbor_table]
+        in_a_row = np.any(missing & np.roll(missing, -1, axis=1), axis=1)
+        return (rings & ~occupied)[:-1] & in_a_row
+
+    def _init_ring_masks(self):
+        # Compute the flattened (w^2) boolean masks of the open rings and the removable rings from
+        # scratch. The masks are kept as part of the board state and are updated by
+        # the actions as they are taken (see _update_removable).
+        rings, occupied = self._get_padded_masks()
+        self._open_mask = (rings & ~occupied)[:-1]
+        self._removable_mask = self._get_removable_mask(rings, occupied)
+
+    def _update_removable(self, locs):
+        # Update the removable ring mask at the flat indices in locs from the open ring mask. This
+        # is the same test as _get_removable_mask done with scalars since only a few locations
+        # change with each action. The rings are looked up in the padded region labels so only
+        # the locations and their neighbors are read. Indices of w^2 (out of bounds) are ignored.
+        labels = self._get_region_labels()
+        size = self.width**2
+        for loc in locs:
+            if loc == size:
+                continue
+            removable = False
+            if self._open_mask[loc]:
+                # Look for two missing neighbors in a row, starting with the last and first
+                neighbors = self._neighbor_lists[loc]
+                previous = labels[neighbors[-1]] != -1
+                for neighbor in neighbors:
+                    ring = labels[neighbor] != -1
+                    if not previous and not ring:
+                        removable = True
+                        break
+                    previous = ring
+            self._removable_mask[loc] = removable
+
     def _is_removable(self, index):
-        # Check if the ring at index is removable. A ring is removable if two of its neighbors 
-        # in a row are missing and the ring itself is empty.
+        # Check if the ring at index is removable (see _get_removable_mask)
         y, x = index
-        if np.sum(self.state[0:4, y, x]) != 1:
-            return False
-        neighbors = self._get_neighbors(index)
-        # Add the first neighbor index to the end so that if the first and last are both empty then it still passes
-        neighbors.append(neighbors[0])
-        # Track the number of consecutive empty neighboring rings
-        adjacent_empty = 0
-        for neighbor in neighbors:
-            if self._is_inbounds(neighbor) and self.state[0][neighbor] == 1:
-                # If the neighbor index is in bounds and not removed then reset the empty counter
-                adjacent_empty = 0
-            else:
-                adjacent_empty += 1
-                if adjacent_empty >= 2:
-                    return True
-        return False
+        return bool(self._removable_mask[y * self.width + x])
 
     def _get_removable_rings(self):
         # Return a list of indices to rings that can be removed
-        removable = [index for index in self._get_open_rings() if self._is_removable(index)]
-        return removable
-
-    def _get_rotational_symmetries(self, state=None):
-        # Rotate the board 180 degrees
+        removable = np.flatnonzero(self._removable_mask)
+        return zip(*np.unravel_index(removable, (self.width, self.width)))
+
+    @classmethod
+    def _get_symmetry_tables(cls, width):
+        # Return a list with the gather tables for each of the 12 symmetries of the hexagonal board.
+        # Symmetry s mirrors the board if s >= 6 and then rotates it (s % 6) * 60 degrees, so
+        # symmetry 0 is the identity, 3 is a 180 degree rotation and 6 is the mirror (transpose).
+        # Each entry is a tuple of flat index arrays (location, placement, capture) so that a
+        # translated layer, placement matrix or capture matrix is original.flat[table]. The tables
+        # are built once for each board width.
+        if width not in cls._SYMMETRY_TABLES:
+            size = width * width
+            mid = width // 2
+            ys, xs = np.divmod(np.arange(size), width)
+            # Coordinates relative to the center of the board. Locations that are not on the board
+            # are always left in place.
+            on_board = np.abs(ys - xs) <= mid
+            tables = []
+            for mirror in (False, True):
+                if mirror:
+                    a, b = xs - mid, ys - mid
+                    directions = np.array([4, 3, 2, 1, 0, 5])
+                else:
+                    a, b = ys - mid, xs - mid
+                    directions = np.arange(6)
+                for rotation in xrange(6):
+                    # Location each location is moved to and direction each direction is moved to
+                    loc_map = np.where(on_board, (a + mid) * width + b + mid, np.arange(size))
+                    dir_map = (directions + rotation) % 6
+                    tables.append(cls._build_symmetry_tables(width, loc_map, dir_map))
+                    # Rotating 60 degrees moves each of the _DIRECTIONS to the next one
+                    a, b = b, b - a
+            cls._SYMMETRY_TABLES[width] = tables
+        return cls._SYMMETRY_TABLES[width]
+
+    @classmethod
+    def get_num_symmetries(cls):
+        # Return the number of symmetries. Symmetries 0 to 11 move the board (see
+        # _get_symmetry_tables) and symmetries 12 to 23 also swap the two players.
+        return 2 * cls._BOARD_SYMMETRIES
+
+    @classmethod
+    def get_inverse_symmetry(cls, symmetry):
+        # Return the symmetry that undoes symmetry. Rotations are undone by rotating back and
+        # mirrored symmetries are their own inverse.
+        opponent, board_symmetry = divmod(symmetry, cls._BOARD_SYMMETRIES)
+        if board_symmetry < 6:
+            board_symmetry = (6 - board_symmetry) % 6
+        return opponent * cls._BOARD_SYMMETRIES + board_symmetry
+
+    @staticmethod
+    def _build_symmetry_tables(width, loc_map, dir_map):
+        # Return the (location, placement, capture) gather tables for the symmetry that moves each
+        # location l to loc_map[l] and each capture direction d to dir_map[d]
+        size = width * width
+        locs = np.empty(size, dtype=np.intp)
+        locs[loc_map] = np.arange(size)
+        # The no removal index stays in place
+        rem_map = np.append(loc_map, size)
+        put_dst = (np.arange(3)[:, None, None] * (size * (size + 1))
+                   + loc_map[None, :, None] * (size + 1) + rem_map[None, None, :])
+        placement = np.empty(put_dst.size, dtype=np.intp)
+        placement[put_dst.ravel()] = np.arange(put_dst.size)
+        cap_dst = dir_map[:, None] * size + loc_map[None, :]
+        capture = np.empty(cap_dst.size, dtype=np.intp)
+        capture[cap_dst.ravel()] = np.arange(cap_dst.size)
+        return locs, placement, capture
+
+    def translate_state(self, symmetry, state=None):
+        # Return a copy of the L x H x W state (default: the current state) with every layer moved
+        # by the symmetry. For symmetries 12 to 23 the captured marbles of the two players and the
+        # current player are also swapped.
         if state is None:
-            rotated_state = np.copy(self.state)
-        else:
-            rotated_state = np.copy(state)
-        rotated_state = np.rot90(np.rot90(rotated_state, axes=(1, 2)), axes=(1, 2))
-        return rotated_state
+            state = self.get_state()
+        opponent, board_symmetry = divmod(symmetry, self._BOARD_SYMMETRIES)
+        locs = self._get_symmetry_tables(self.width)[board_symmetry][0]
+        layers = state.shape[0]
+        flat = state.reshape(layers, self.width**2)
+        if not opponent:
+            return flat[:, locs].reshape(state.shape)
+        history = 4 * self.t
+        order = np.arange(layers)
+        order[history + 4: history + 10] = np.roll(order[history + 4: history + 10], 3)
+        translated = flat[np.ix_(order, locs)].reshape(state.shape)
+        translated[history + 10] = 1 - translated[history + 10]
+        return translated
 
-    def _get_mirror_symmetries(self, state=None):
-        # Flip the board while maintaining adjacency
-        if state is None:
-            mirror_state = np.copy(self.state)
+    def translate_action(self, action_type, symmetry, actions, inverse=False):
+        # Return a copy of the placement or capture matrix (or any array with the same number of
+        # values) moved by the symmetry, or by the inverse of the symmetry if inverse is True (i.e.
+        # to move a policy predicted for a translated state back). The result has the shape of
+        # the action matrix. Swapping the players does not change the actions.
+        if inverse:
+            symmetry = self.get_inverse_symmetry(symmetry)
+        tables = self._get_symmetry_tables(self.width)[symmetry % self._BOARD_SYMMETRIES]
+        if action_type == 'PUT':
+            table = tables[1]
+            shape = self.get_placement_shape()
         else:
-            mirror_state = np.copy(state)
-        layers = mirror_state.shape[0]
-        for i in xrange(layers):
-            mirror_state[i] = mirror_state[i].T
-        return mirror_state
+            table = tables[2]
+            shape = self.get_capture_shape()
+        return np.asarray(actions).reshape(-1)[table].reshape(shape)
 
     def get_state_symmetries(self):
-        # Return a list of symmetrical states by mirroring and rotating the board
-        symmetries = []
-        symmetries.append((0, self._get_mirror_symmetries()))
-        symmetries.append((1, self._get_rotational_symmetries()))
-        symmetries.append((2, self._get_rotational_symmetries(symmetries[0][1])))
-        return symmetries
+        # Return a list of (symmetry, state) for every symmetry of the current state, starting
+        # with the identity (see get_num_symmetries)
+        state = self.get_state()
+        return [(symmetry, self.translate_state(symmetry, state))
+                for symmetry in xrange(self.get_num_symmetries())]
 
     def mirror_action(self, action_type, translated):
-        if action_type == 'CAP':
-            # swap capture direction axes
-            temp = np.copy(translated)
-            translated[3], translated[1] = temp[1], temp[3]
-            translated[4], translated[0] = temp[0], temp[4]
-
-            # transpose location axes
-            d = translated.shape[0]
-            for i in xrange(d):
-                translated[i] = translated[i].T
-
-        elif action_type == 'PUT':
-            temp = np.copy(translated)
-            _, put, rem = translated.shape
-            for p in xrange(put):
-                # Translate the put index
-                put_y, put_x = p / self.width, p % self.width
-                new_p = put_x * self.width + put_y
-                for r in xrange(rem - 1):
-                    # Translate the rem index
-                    rem_y, rem_x = r / self.width, r % self.width
-                    new_r = rem_x * self.width + rem_y
-                    translated[:, new_p, new_r] = temp[:, p, r]
-
-                # The last rem index is the same
-                translated[:, new_p, rem - 1] = translated[:, new_p, rem - 1]
-
-        return translated
+        return self.translate_action(action_type, 6, translated)
 
     def rotate_action(self, action_type, translated):
-
-        mid = self.width / 2 # board width must be odd
-        if action_type == 'CAP':
-            # swap capture direction axes
-            temp = np.copy(translated)
-            translated[3], translated[0] = temp[0], temp[3]
-            translated[4], translated[1] = temp[1], temp[4]
-            translated[5], translated[2] = temp[2], temp[5]
-
-            # rotate location axes
-            temp = np.copy(translated)
-            _, y, x = temp.shape
-            for i in xrange(y):
-                new_i = mid + (mid - i)
-                for j in xrange(x):
-                    new_j = mid + (mid - j)
-                    translated[:, new_i, new_j] = temp[:, i, j]
-
-        if action_type == 'PUT':
-            temp = np.copy(translated)
-            _, put, rem = translated.shape
-            for p in xrange(put):
-                # Translate the put index
-                put_y, put_x = p / self.width, p % self.width
-                put_y = mid + (mid - put_y)
-                put_x = mid + (mid - put_x)
-                new_p = put_y * self.width + put_x
-                for r in xrange(rem - 1):
-                    # Translate the rem index
-                    rem_y, rem_x = r / self.width, r % self.width
-                    rem_y = mid + (mid - rem_y)
-                    rem_x = mid + (mid - rem_x)
-                    new_r = rem_y * self.width + rem_x
-                    translated[:, new_p, new_r] = temp[:, p, r]
-
-                # The last rem index is the same
-                translated[:, new_p, rem - 1] = translated[:, new_p, rem - 1]
-
-        return translated
+        # Rotate 180 degrees
+        return self.translate_action(action_type, 3, translated)
 
     def str_to_index(self, index_str):
         # Given a string like 'A1' return an index (y, x) based on the board shape